@@ -1,16 +1,29 @@
+import itertools
 import logging
 import signal
 import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from enum import Enum, auto
+from functools import partial
+from typing import Any, Callable, Dict, NamedTuple, Optional, Union
 
 from pycommons.asr import States
+from pycommons.audio.bus import CaptureBus
+from pycommons.audio.devices import registry
 from pycommons.audio.seeed4micvoicecard import Seeed4micVoiceCard
-from pycommons.audio.source import Microphone
+from pycommons.audio.source import create_source
 from pycommons.config.config import Config, load_config
+from pycommons.mqtt import MqttClient
 
 from asr.asr.kws import Snowboy
 from asr.asr.sad import SpeechActivityDetection
-from asr.asr.stt import DeepSpeech
+from asr.asr.stt import (
+    SpeechToText,
+    SpeechToTextClient,
+    SpeechToTextPool,
+    create_stt,
+)
 
 
 class Handlers(Enum):
@@ -21,6 +34,11 @@ class Handlers(Enum):
     SOURCE = auto()
 
 
+class Pipeline(NamedTuple):
+    stt: Union[SpeechToText, SpeechToTextPool, SpeechToTextClient]
+    topic: str
+
+
 class Service:
     def __init__(self, config: Config) -> None:
         # signals to close app
@@ -28,18 +46,49 @@ class Service:
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
 
-        self.handlers = {
+        self.handlers: Dict[Handlers, Any] = {
             Handlers.KWS: Snowboy(config, self.termination_event),
             Handlers.SAD: SpeechActivityDetection(config, self.termination_event),
-            Handlers.STT: DeepSpeech(config),
-            Handlers.SOURCE: Microphone(config),
+            Handlers.STT: create_stt(config),
+            Handlers.SOURCE: CaptureBus(config, create_source(config)).start(),
         }
         self.subscribers = {Seeed4micVoiceCard(self.termination_event)}
 
+        # transcripts are published per session, partial ones while speaking
+        self.topic = config.mqtt.topic
+        # a hotword model may have its own stt and topic
+        self.pipelines: Dict[str, Pipeline] = {
+            model: Pipeline(
+                create_stt(pipeline),
+                self.topic if pipeline.topic is None else pipeline.topic,
+            )
+            for model, pipeline in (config.pipelines or {}).items()
+        }
+        self.default_pipeline = Pipeline(self.handlers[Handlers.STT], self.topic)
+        self.mqtt: Optional[MqttClient] = None
+        if config.mqtt.enable:
+            self.mqtt = MqttClient("asr")
+            self.mqtt.connect_async(config.mqtt.host, config.mqtt.port)
+            self.mqtt.loop_start()
+
+        # kws keeps listening in every state, so a wake word can barge in
+        self.hotword_event = threading.Event()
+        self.hotword: Optional[str] = None
+        # capture position where the hotword ended
+        self.hotword_position: Optional[float] = None
+        # a replay waits for its session to end instead of barging in
+        self.session_ended = threading.Event()
+        self.session: Dict = {}
+        self._session_lock = threading.Lock()
+        self.listener = threading.Thread(target=self._listen, name="kws", daemon=True)
+        # decodes run aside so waiting for them can be cancelled
+        self.transcriber = ThreadPoolExecutor(max_workers=1)
+
     def run(self):
         state = States.STANDBY
         session = {}
         state_change_event = threading.Event()
+        self.listener.start()
 
         while not self.termination_event.is_set():
             state_change_event.set()
@@ -48,19 +97,148 @@ class Service:
                 subscriber(state, state_change_event)
 
             if state is States.STANDBY:
-                session = {}
-                self.handlers[Handlers.KWS]()
-                state = States.RECORD
+                if self._wait_hotword():
+                    session = self._new_session(self.hotword, self.hotword_position)
+                    state = States.RECORD
             elif state is States.RECORD:
+                session["stt"].begin(session)
                 self.handlers[Handlers.SAD](session, self.handlers[Handlers.SOURCE])
-                state = States.TRANSCRIPT
+                if session["cancel"].is_set():
+                    logger.info(f"session {session['id']} cancelled")
+                    # without frames the stt only releases its stream
+                    self.transcriber.submit(session["stt"], session)
+                    self._end_session()
+                    state = States.STANDBY
+                else:
+                    state = States.TRANSCRIPT
             elif state is States.TRANSCRIPT:
-                self.handlers[Handlers.STT](session)
-                if "command" in session:
-                    logger.info("command = {}".format(session["command"]))
+                future = self.transcriber.submit(session["stt"], session)
+                if not self._wait(session, future):
+                    # a decode that is already running finishes, its result is
+                    # ignored
+                    logger.info(f"session {session['id']} cancelled")
+                elif future.exception() is not None:
+                    logger.error(f"stt failed: {future.exception()}")
+                elif "future" in session:
+                    session["future"].add_done_callback(
+                        partial(self._on_future, session)
+                    )
+                elif "command" in session:
+                    self._on_command(session, session["command"])
+                self._end_session()
                 state = States.STANDBY
 
         logger.info("termination event recognised")
+        # closing the bus wakes the listener when it waits for frames
+        self.handlers[Handlers.SOURCE].close()
+        self.listener.join(timeout=5)
+        if self.listener.is_alive():
+            logger.warning("kws listener did not stop")
+        self.transcriber.shutdown(wait=False)
+        registry.terminate()
+        for pipeline in [self.default_pipeline, *self.pipelines.values()]:
+            logger.info(f"stt report: {pipeline.stt.report()}")
+            pipeline.stt.shutdown()
+        if self.mqtt is not None:
+            self.mqtt.loop_stop()
+            self.mqtt.disconnect()
+
+    def _new_session(self, hotword: Optional[str], start: Optional[float]) -> Dict:
+        pipeline = self.default_pipeline
+        if hotword is not None:
+            pipeline = self.pipelines.get(hotword, pipeline)
+        session: Dict = {
+            "id": uuid.uuid4().hex,
+            "hotword": hotword,
+            # recording starts after the hotword
+            "start": start,
+            "stt": pipeline.stt,
+            "cancel": threading.Event(),
+        }
+        if self.mqtt is not None:
+            session["on_partial"] = self._publisher(
+                self.mqtt, pipeline.topic, session["id"]
+            )
+        with self._session_lock:
+            self.session = session
+        return session
+
+    def _end_session(self) -> None:
+        # results still decoded by the pool are not cancelled by a new session
+        with self._session_lock:
+            self.session = {}
+        self.session_ended.set()
+
+    def _listen(self) -> None:
+        bus = self.handlers[Handlers.SOURCE]
+        # a replayed source ends after its last file
+        while not self.termination_event.is_set() and bus.running:
+            hotword = self.handlers[Handlers.KWS](bus)
+            if hotword is not None:
+                with self._session_lock:
+                    if "cancel" in self.session:
+                        self.session["cancel"].set()
+                self.hotword = hotword
+                self.hotword_position = self.handlers[Handlers.KWS].position
+                # a replay waits for the recording instead of running ahead
+                bus.expect("sad")
+                self.session_ended.clear()
+                self.hotword_event.set()
+                if not bus.live:
+                    # a replay runs ahead of the decode, its next hotword would
+                    # cancel every session before its transcript is published;
+                    # without a subscriber the bus holds the replay meanwhile
+                    while not self.session_ended.wait(timeout=1):
+                        if self.termination_event.is_set():
+                            break
+        if bus.error is not None:
+            logger.error("audio source failed: %s", bus.error)
+            self.termination_event.set()
+
+    def _wait_hotword(self) -> bool:
+        while not self.hotword_event.wait(timeout=1):
+            if self.termination_event.is_set():
+                return False
+            if not self.listener.is_alive():
+                logger.info("audio source ended")
+                self.termination_event.set()
+                return False
+        self.hotword_event.clear()
+        return True
+
+    def _wait(self, session: Dict, future: Future) -> bool:
+        """Waits for future, returns False when the session is cancelled first."""
+        while not session["cancel"].is_set():
+            if self.termination_event.is_set():
+                return False
+            done, _ = wait([future], timeout=0.05)
+            if done:
+                return True
+        return False
+
+    def _publisher(
+        self, mqtt: MqttClient, topic: str, session_id: str
+    ) -> Callable[..., None]:
+        topic = f"{topic}/{session_id}"
+        sequence = itertools.count()
+
+        def publish(text: str, final: bool = False) -> None:
+            mqtt.publish(topic, {"seq": next(sequence), "text": text, "final": final})
+
+        return publish
+
+    def _on_future(self, session: Dict, future: Future) -> None:
+        if session["cancel"].is_set():
+            logger.info(f"result of cancelled session {session['id']} discarded")
+        elif future.exception() is not None:
+            logger.error(f"stt failed: {future.exception()}")
+        else:
+            self._on_command(session, future.result())
+
+    def _on_command(self, session: Dict, command: str) -> None:
+        logger.info("command = {}".format(command))
+        if "on_partial" in session:
+            session["on_partial"](command, final=True)
 
     def _signal_handler(self, signal_number, frame):
         # logger.info(f"Signal: {signal.strsignal(signal_number)} and {frame}")
@@ -0,0 +1,107 @@
+import argparse
+import json
+import logging
+import resource
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from pycommons.config.config import Config, load_config
+
+from asr.asr.corpus import Utterance, load_corpus, word_error_rate, word_errors
+from asr.asr.stt import STT_ENGINES, SpeechToText, create_engine
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark(stt: SpeechToText, corpus: List[Utterance]) -> List[Dict]:
+    results = []
+    for utterance in corpus:
+        context: Dict[str, Any] = {"frames": utterance.audio}
+        ts_start = time.perf_counter()
+        stt(context)
+        latency = time.perf_counter() - ts_start
+
+        result = {
+            "file": utterance.name,
+            "duration": utterance.duration,
+            "latency": latency,
+            "rtf": latency / utterance.duration,
+            "transcript": context["command"],
+        }
+        if utterance.transcript is not None:
+            result["reference"] = utterance.transcript
+            result["word_errors"] = word_errors(
+                utterance.transcript, context["command"]
+            )
+        logger.info(f"{utterance.name}: rtf={result['rtf']:.3f}")
+        results.append(result)
+    return results
+
+
+def summarize(results: List[Dict], load_time: float) -> Dict:
+    latencies = np.array([result["latency"] for result in results])
+    duration = sum(result["duration"] for result in results)
+    labelled = [result for result in results if "reference" in result]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if results else (0, 0, 0)
+    return {
+        "files": len(results),
+        "audio_duration": duration,
+        "decode_time": float(latencies.sum()),
+        "rtf": float(latencies.sum()) / duration if duration > 0 else 0.0,
+        "latency_p50": float(p50),
+        "latency_p95": float(p95),
+        "latency_p99": float(p99),
+        "load_time": load_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "wer": word_error_rate(
+            [result["reference"] for result in labelled],
+            [result["transcript"] for result in labelled],
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Runs the stt handler over a folder of wav files and "
+        "reports real-time factor, latency, memory and word error rate as json"
+    )
+    parser.add_argument("corpus", help="folder of 16 kHz mono wav files")
+    parser.add_argument("--config", default="asr.yaml", help="asr config file")
+    parser.add_argument("--output", help="write the report to this file")
+    args = parser.parse_args()
+
+    config: Config = load_config(args.config)["asr"]
+    if config.stt.yaml_tag not in STT_ENGINES:
+        parser.error(
+            f"stt {config.stt.yaml_tag} is not an engine, "
+            f"benchmark one of {', '.join(STT_ENGINES)}"
+        )
+    ts_start = time.perf_counter()
+    stt = create_engine(config)
+    stt.wait_loaded()
+    load_time = time.perf_counter() - ts_start
+
+    results = benchmark(stt, load_corpus(args.corpus, stt.sampling_rate))
+    report = json.dumps(
+        {
+            "summary": summarize(results, load_time),
+            "engine": stt.report(),
+            "files": results,
+        },
+        indent=2,
+    )
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w") as output:
+            output.write(report)
+
+
+if __name__ == "__main__":
+    main()
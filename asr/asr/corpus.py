@@ -0,0 +1,74 @@
+import logging
+import os
+import wave
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Utterance(NamedTuple):
+    name: str
+    audio: np.ndarray
+    sampling_rate: int
+    transcript: Optional[str]
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / self.sampling_rate
+
+
+def read_wav(path: str) -> Tuple[np.ndarray, int]:
+    with wave.open(path, "rb") as wav:
+        if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+            raise ValueError(f"{path} is not a mono 16 bit wav file")
+        audio = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        return audio, wav.getframerate()
+
+
+def load_corpus(directory: str, sampling_rate: int) -> List[Utterance]:
+    """Loads every wav file of a directory with the transcript next to it.
+
+    The reference transcript of 'name.wav' is read from 'name.txt', files
+    without one are still loaded so their latency can be measured.
+    """
+    corpus = []
+    for file_name in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(file_name)
+        if extension.lower() != ".wav":
+            continue
+        audio, rate = read_wav(os.path.join(directory, file_name))
+        if rate != sampling_rate:
+            raise ValueError(f"{file_name} has {rate} Hz, expected {sampling_rate} Hz")
+
+        transcript = None
+        transcript_path = os.path.join(directory, name + ".txt")
+        if os.path.exists(transcript_path):
+            with open(transcript_path, "r") as transcript_file:
+                transcript = " ".join(transcript_file.read().lower().split())
+        corpus.append(Utterance(name, audio, rate, transcript))
+    logger.info(f"loaded {len(corpus)} utterances from {directory}")
+    return corpus
+
+
+def word_errors(reference: str, hypothesis: str) -> int:
+    """Returns the word level edit distance between two transcripts."""
+    ref = reference.split()
+    hyp = hypothesis.split()
+    distances = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        previous, distances[0] = distances[0], i
+        for j, hyp_word in enumerate(hyp, start=1):
+            previous, distances[j] = distances[j], min(
+                distances[j] + 1,
+                distances[j - 1] + 1,
+                previous + (ref_word != hyp_word),
+            )
+    return distances[-1]
+
+
+def word_error_rate(references: List[str], hypotheses: List[str]) -> float:
+    errors = sum(word_errors(r, h) for r, h in zip(references, hypotheses))
+    words = sum(len(r.split()) for r in references)
+    return errors / words if words > 0 else 0.0
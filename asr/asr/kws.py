@@ -1,35 +1,253 @@
 import logging
+import time
+from collections import deque
 from threading import Event
+from typing import Callable, Deque, Dict, List, Optional
 
-from pycommons.config.config import RESOURCES_DIRECTORY_PATH, Config
-from snowboy import snowboydecoder
+import numpy as np
+from pycommons import instrumentation
+from pycommons.audio.processing import frame_size
+from pycommons.config.config import RESOURCES_DIRECTORY_PATH, Config, EnergyGateConfig
+from snowboy import snowboydecoder, snowboydetect
 
 logger: logging.Logger = logging.getLogger(__name__)
 
 
+class EnergyGate:
+    """Passes audio on to the detector only while there may be speech in it.
+
+    A block opens the gate when its energy is margin_db above the tracked
+    noise floor, or half of that for blocks with a high zero crossing rate
+    like the onset of a fricative. The gate stays open for hangover
+    milliseconds after the last such block. On opening, the last lookback
+    milliseconds are passed on first so the onset of the hotword is not
+    clipped. While closed, the noise floor follows the energy, falling at
+    once and rising slowly.
+
+    While open, the floor rises towards the minimum energy of the last
+    NOISE_WINDOW milliseconds. Speech has pauses that keep this minimum
+    down, while a lasting louder noise like a fan raises it. The gate then
+    closes again after the floor catches up.
+    """
+
+    MIN_ENERGY_DB = -90.0
+    NOISE_ADAPTATION = 0.02
+    # minimum statistics over a window kept as minima of its sub-windows
+    NOISE_WINDOW = 3000
+    NOISE_SUBWINDOWS = 6
+
+    def __init__(
+        self, config: Config, gate: EnergyGateConfig, sampling_rate: int
+    ) -> None:
+        self.margin_db = gate.margin_db
+        self.zcr_threshold = gate.zcr_threshold
+        block_duration = frame_size(config, sampling_rate) / sampling_rate * 1000
+        self.hangover = max(round(gate.hangover / block_duration), 1)
+        self._lookback: Deque[bytes] = deque(
+            maxlen=max(round(gate.lookback / block_duration), 1)
+        )
+        self._subwindow = max(
+            round(self.NOISE_WINDOW / self.NOISE_SUBWINDOWS / block_duration), 1
+        )
+        self._minima: Deque[float] = deque(maxlen=self.NOISE_SUBWINDOWS)
+        self.blocks = 0
+        self.skipped = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.noise_floor_db: Optional[float] = None
+        self.is_open = False
+        self._remaining = 0
+        self._lookback.clear()
+        self._minima.clear()
+        self._minimum = float("inf")
+        self._count = 0
+
+    def _track_minimum(self, energy_db: float) -> float:
+        """Returns the minimum energy over the noise window."""
+        self._minimum = min(self._minimum, energy_db)
+        self._count += 1
+        if self._count == self._subwindow:
+            self._minima.append(self._minimum)
+            self._minimum = float("inf")
+            self._count = 0
+        return min(self._minimum, min(self._minima, default=self._minimum))
+
+    @property
+    def duty_cycle(self) -> float:
+        return 1 - self.skipped / self.blocks if self.blocks else 1.0
+
+    def __call__(self, frames: bytes) -> List[bytes]:
+        """Returns the blocks to pass on to the detector, none while closed."""
+        self.blocks += 1
+        samples = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768
+        energy_db = max(
+            10 * float(np.log10(np.mean(np.square(samples)) + 1e-12)),
+            self.MIN_ENERGY_DB,
+        )
+        zcr = np.count_nonzero(np.diff(np.signbit(samples))) / len(samples)
+
+        minimum = self._track_minimum(energy_db)
+        if self.noise_floor_db is None:
+            self.noise_floor_db = energy_db
+        margin = energy_db - self.noise_floor_db
+        if margin > self.margin_db or (
+            margin > self.margin_db / 2 and zcr > self.zcr_threshold
+        ):
+            self._remaining = self.hangover
+        elif self._remaining > 0:
+            self._remaining -= 1
+
+        if self._remaining > 0:
+            if minimum > self.noise_floor_db:
+                self.noise_floor_db += self.NOISE_ADAPTATION * (
+                    minimum - self.noise_floor_db
+                )
+            if not self.is_open:
+                self.is_open = True
+                blocks = [*self._lookback, frames]
+                self._lookback.clear()
+                return blocks
+            return [frames]
+
+        self.is_open = False
+        self.skipped += 1
+        self._lookback.append(frames)
+        if energy_db < self.noise_floor_db:
+            self.noise_floor_db = energy_db
+        else:
+            self.noise_floor_db += self.NOISE_ADAPTATION * margin
+        return []
+
+    def report(self) -> Dict:
+        return {
+            "blocks": self.blocks,
+            "skipped": self.skipped,
+            "duty_cycle": self.duty_cycle,
+            "noise_floor_db": self.noise_floor_db,
+        }
+
+
 class Snowboy:
+    """Wake word detection with one or more snowboy models.
+
+    All models are loaded into a single detector, so every block of audio is
+    evaluated in one pass no matter how many wake words are configured. A
+    detection reports the model that fired.
+    """
+
     def __init__(self, config: Config, interrupt_event: Event) -> None:
         self.interrupt_event = interrupt_event
-        self.detected = False
+        models = config.kws.decoder_model
+        self.models: List[str] = models if isinstance(models, list) else [models]
+        paths = [RESOURCES_DIRECTORY_PATH + model for model in self.models]
+        # a universal model may hold several hotwords, the detector numbers
+        # the hotwords of all models in order
+        self.hotwords: List[str] = []
+        for model, path in zip(self.models, paths):
+            count = snowboydetect.SnowboyDetect(
+                resource_filename=snowboydecoder.RESOURCE_FILE.encode(),
+                model_str=path.encode(),
+            ).NumHotwords()
+            self.hotwords.extend([model] * count)
+        sensitivity = config.kws.sensitivity
+        if (
+            isinstance(sensitivity, list)
+            and len(self.models) > 1
+            and len(sensitivity) == len(self.models)
+        ):
+            # one sensitivity per model, the detector wants one per hotword
+            sensitivity = [
+                value
+                for model, value in zip(self.models, sensitivity)
+                for _ in range(self.hotwords.count(model))
+            ]
+        self.status = 0
+        # capture position right after the last detected hotword
+        self.position: Optional[float] = None
+        # only the detector is used, audio is read from the capture bus
         self.hwd = snowboydecoder.HotwordDetector(
-            decoder_model=RESOURCES_DIRECTORY_PATH + config.kws.decoder_model,
-            sensitivity=config.kws.sensitivity,
+            decoder_model=paths,
+            sensitivity=sensitivity,
             audio_gain=config.kws.audio_gain,
             apply_frontend=config.kws.apply_frontend,
         )
+        self.gate: Optional[EnergyGate] = None
+        gate = config.kws.energy_gate
+        if gate is not None and gate.enable:
+            self.gate = EnergyGate(config, gate, self.sampling_rate)
 
-    def __call__(self) -> None:
-        logger.info("kws using snowboy")
-        self.detected = False
-        self.hwd.start(
-            interrupt_check=self._interrupt_callback,
-            detected_callback=self._detected_callback,
-        )
-        self.hwd.terminate()
+    @property
+    def sampling_rate(self) -> int:
+        return self.hwd.detector.SampleRate()
+
+    def detect(self, frames: bytes) -> Optional[str]:
+        """Runs the detector on one block of audio.
+
+        Returns the model of the hotword detected in the block, None if
+        there is none. The status of the detector is kept in status.
+        """
+        self.status = self.hwd.detector.RunDetection(frames)
+        if self.status > 0:
+            # forget the hotword so it does not fire again on its tail
+            self.hwd.detector.Reset()
+            return self.hotwords[self.status - 1]
+        if self.status == -1:
+            logger.warning("error initializing streams or reading audio data")
+        return None
 
-    def _interrupt_callback(self):
-        return self.interrupt_event.is_set() or self.detected
+    def process(self, frames: bytes) -> Optional[str]:
+        """Runs one block through the energy gate and the detector."""
+        if self.gate is None:
+            blocks = [frames]
+        else:
+            was_open = self.gate.is_open
+            blocks = self.gate(frames)
+            if blocks and not was_open:
+                # the skipped audio left the detector with a gap
+                self.hwd.detector.Reset()
+        for block in blocks:
+            detected = self.detect(block)
+            if detected is not None:
+                return detected
+        return None
 
-    def _detected_callback(self):
-        logger.info("hotword detected")
-        self.detected = True
+    def reset(self) -> None:
+        """Starts over for audio that does not continue the previous blocks."""
+        self.hwd.detector.Reset()
+        if self.gate is not None:
+            self.gate.reset()
+
+    def __call__(self, source: Callable) -> Optional[str]:
+        """Listens until a hotword is detected or the service terminates.
+
+        Returns the model of the detected hotword, None on termination.
+        """
+        logger.info("kws using snowboy")
+        detected = None
+        stats = instrumentation.session("kws")
+        with source("kws", rate=self.sampling_rate) as stream:
+            for frames in stream.read():
+                if self.interrupt_event.is_set():
+                    break
+                if stats.enabled:
+                    started = time.perf_counter()
+                    detected = self.process(frames)
+                    stats.observe("detection_time", time.perf_counter() - started)
+                    stats.observe("bus_lag", stream.lag())
+                    if self.gate is not None and not self.gate.is_open:
+                        stats.frame("gated")
+                    else:
+                        stats.frame("silence" if self.status == -2 else "speech")
+                    if self.status == -1:
+                        stats.count("errors")
+                else:
+                    detected = self.process(frames)
+                if detected is not None:
+                    self.position = stream.position()
+                    logger.info(f"hotword of {detected} detected")
+                    break
+        if self.gate is not None:
+            logger.info(f"energy gate: {self.gate.report()}")
+        instrumentation.emit(stats)
+        return detected
@@ -0,0 +1,185 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from pycommons.audio.processing import frame_size
+from pycommons.config.config import Config, load_config
+
+from asr.asr.corpus import Utterance, load_corpus
+from asr.asr.kws import Snowboy
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def run(kws: Snowboy, audio: np.ndarray, block_size: int) -> List[Dict]:
+    """Feeds audio block by block as fast as possible.
+
+    Returns every detection with the model that fired and the position in
+    seconds of the end of the block it fired on.
+    """
+    kws.reset()
+    detections = []
+    for start in range(0, len(audio) - block_size + 1, block_size):
+        model = kws.process(audio[start : start + block_size].tobytes())
+        if model is not None:
+            end = (start + block_size) / kws.sampling_rate
+            detections.append({"model": model, "time": end})
+    return detections
+
+
+def benchmark_positives(
+    kws: Snowboy, clips: List[Utterance], block_size: int, padding: float
+) -> List[Dict]:
+    """Runs every clip, each ending where its hotword ends, padded by silence.
+
+    A detection up to padding seconds after the end of the clip counts as a
+    hit, its latency is measured from the end of the hotword.
+    """
+    silence = np.zeros(int(padding * kws.sampling_rate), dtype=np.int16)
+    results = []
+    for clip in clips:
+        detections = run(
+            kws, np.concatenate((silence, clip.audio, silence)), block_size
+        )
+        result = {"file": clip.name, "duration": clip.duration, "detected": False}
+        if detections:
+            first = detections[0]
+            result["detected"] = True
+            result["model"] = first["model"]
+            result["latency"] = first["time"] - padding - clip.duration
+            result["detections"] = len(detections)
+        logger.info(f"{clip.name}: {result}")
+        results.append(result)
+    return results
+
+
+def benchmark_background(
+    kws: Snowboy, recordings: List[Utterance], block_size: int
+) -> List[Dict]:
+    """Runs recordings without the hotword, every detection is a false accept."""
+    results = []
+    for recording in recordings:
+        detections = run(kws, recording.audio, block_size)
+        results.append(
+            {
+                "file": recording.name,
+                "duration": recording.duration,
+                "false_accepts": detections,
+            }
+        )
+        logger.info(f"{recording.name}: {len(detections)} false accepts")
+    return results
+
+
+def summarize(
+    positives: List[Dict], background: List[Dict], cpu_time: float, duration: float
+) -> Dict:
+    hits = [result for result in positives if result["detected"]]
+    latencies = np.array([result["latency"] for result in hits])
+    p50, p95 = np.percentile(latencies, [50, 95]) if hits else (None, None)
+    hours = sum(result["duration"] for result in background) / 3600
+    false_accepts = sum(len(result["false_accepts"]) for result in background)
+    return {
+        "clips": len(positives),
+        "miss_rate": 1 - len(hits) / len(positives) if positives else None,
+        "latency_mean": float(latencies.mean()) if hits else None,
+        "latency_p50": None if p50 is None else float(p50),
+        "latency_p95": None if p95 is None else float(p95),
+        "background_hours": hours,
+        "false_accepts": false_accepts,
+        "false_accepts_per_hour": false_accepts / hours if hours > 0 else None,
+        "audio_duration": duration,
+        "cpu_time": cpu_time,
+        # cpu seconds spent per hour of audio
+        "cpu_per_audio_hour": cpu_time / (duration / 3600) if duration > 0 else None,
+        "speed": duration / cpu_time if cpu_time > 0 else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Runs the wake word detector faster than real time over "
+        "hotword clips and background recordings and reports detection "
+        "latency, miss rate, false accepts per hour and cpu usage as json"
+    )
+    parser.add_argument(
+        "--positives",
+        help="folder of mono wav clips, each ending where its hotword ends",
+    )
+    parser.add_argument(
+        "--background", help="folder of mono wav recordings without the hotword"
+    )
+    parser.add_argument("--config", default="asr.yaml", help="asr config file")
+    parser.add_argument(
+        "--sensitivity",
+        type=float,
+        nargs="+",
+        help="overrides the sensitivity of the config",
+    )
+    parser.add_argument(
+        "--audio-gain", type=float, help="overrides the audio gain of the config"
+    )
+    parser.add_argument(
+        "--padding",
+        type=float,
+        default=1.0,
+        help="seconds of silence around a clip, a later detection is a miss",
+    )
+    parser.add_argument("--output", help="write the report to this file")
+    args = parser.parse_args()
+    if args.positives is None and args.background is None:
+        parser.error("at least one of --positives and --background is required")
+
+    config: Config = load_config(args.config)["asr"]
+    if args.sensitivity is not None:
+        config.kws.sensitivity = args.sensitivity
+    if args.audio_gain is not None:
+        config.kws.audio_gain = args.audio_gain
+    kws = Snowboy(config, threading.Event())
+    block_size = frame_size(config, kws.sampling_rate)
+
+    clips: List[Utterance] = []
+    recordings: List[Utterance] = []
+    if args.positives is not None:
+        clips = load_corpus(args.positives, kws.sampling_rate)
+    if args.background is not None:
+        recordings = load_corpus(args.background, kws.sampling_rate)
+    duration = sum(clip.duration + 2 * args.padding for clip in clips) + sum(
+        recording.duration for recording in recordings
+    )
+
+    cpu_start = time.process_time()
+    positives = benchmark_positives(kws, clips, block_size, args.padding)
+    background = benchmark_background(kws, recordings, block_size)
+    cpu_time = time.process_time() - cpu_start
+
+    report = json.dumps(
+        {
+            "config": {
+                "decoder_model": config.kws.decoder_model,
+                "sensitivity": config.kws.sensitivity,
+                "audio_gain": config.kws.audio_gain,
+                "apply_frontend": config.kws.apply_frontend,
+                "energy_gate": repr(config.kws.energy_gate),
+                "block_size": block_size,
+            },
+            "summary": summarize(positives, background, cpu_time, duration),
+            "energy_gate": None if kws.gate is None else kws.gate.report(),
+            "positives": positives,
+            "background": background,
+        },
+        indent=2,
+    )
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w") as output:
+            output.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 import logging
-from collections import deque
+import time
 from threading import Event
-from typing import Callable, Deque, Dict
+from typing import Callable, Dict, Optional
 
-import webrtcvad
+import numpy as np
+from pycommons import instrumentation
+from pycommons.audio.buffer import UtteranceBuffer
+from pycommons.audio.processing import frame_size
 from pycommons.config.config import Config
 
+from asr.asr.vad import VAD_ENGINES
+
 logger: logging.Logger = logging.getLogger(__name__)
 
 
@@ -13,6 +18,10 @@ class InterruptEvent(Exception):
     pass
 
 
+class SessionCancelled(Exception):
+    pass
+
+
 class InsufficientSpeech(Exception):
     pass
 
@@ -21,65 +30,208 @@ class SpeechThresholdExceeded(Exception):
     pass
 
 
+class Endpointer:
+    """Decides on which frame an utterance has ended.
+
+    The trailing silence needed to end an utterance grows from
+    short_silence_threshold for utterances with min_speech_duration_threshold
+    frames of speech to long_silence_threshold for utterances reaching
+    max_speech_duration_threshold, as longer utterances tend to have longer
+    pauses. The frame energy of noise and speech is tracked and at a low
+    signal to noise ratio, where the vad misses quiet speech, the silence
+    needed is extended by up to half.
+    """
+
+    ENERGY_ADAPTATION = 0.05
+    LOW_SNR_DB = 10.0
+    HIGH_SNR_DB = 25.0
+    MAX_NOISE_EXTENSION = 0.5
+
+    def __init__(self, config: Config) -> None:
+        self.short_silence_threshold = config.sad.short_silence_threshold
+        self.long_silence_threshold = config.sad.long_silence_threshold
+        self.min_speech_duration_threshold = config.sad.min_speech_duration_threshold
+        self.max_speech_duration_threshold = config.sad.max_speech_duration_threshold
+        self.reset()
+
+    @property
+    def max_silence(self) -> int:
+        """Returns the longest trailing silence that may be required."""
+        return int(self.long_silence_threshold * (1 + self.MAX_NOISE_EXTENSION))
+
+    def reset(self) -> None:
+        self.silence_counter = 0
+        self.speech_counter = 0
+        self.last_speech: Optional[int] = None
+        self.noise_energy: Optional[float] = None
+        self.speech_energy: Optional[float] = None
+
+    def snr(self) -> Optional[float]:
+        if self.noise_energy is None or self.speech_energy is None:
+            return None
+        return 10 * np.log10((self.speech_energy + 1e-9) / (self.noise_energy + 1e-9))
+
+    def silence_threshold(self) -> int:
+        """Returns the trailing silence in frames that ends the utterance now."""
+        span = self.max_speech_duration_threshold - self.min_speech_duration_threshold
+        progress = min(
+            max(self.speech_counter - self.min_speech_duration_threshold, 0)
+            / max(span, 1),
+            1.0,
+        )
+        threshold = self.short_silence_threshold + progress * (
+            self.long_silence_threshold - self.short_silence_threshold
+        )
+        snr = self.snr()
+        if snr is not None:
+            noise = (self.HIGH_SNR_DB - snr) / (self.HIGH_SNR_DB - self.LOW_SNR_DB)
+            threshold *= 1 + self.MAX_NOISE_EXTENSION * min(max(noise, 0.0), 1.0)
+        return int(threshold)
+
+    def __call__(self, index: int, is_speech: bool, energy: float) -> bool:
+        if is_speech:
+            self.silence_counter = 0
+            self.speech_counter += 1
+            self.last_speech = index
+            self.speech_energy = self._track(self.speech_energy, energy)
+        else:
+            self.silence_counter += 1
+            self.noise_energy = self._track(self.noise_energy, energy)
+
+        if self.speech_counter <= self.min_speech_duration_threshold:
+            # wait as long as possible for a hesitant speaker
+            if self.silence_counter > self.long_silence_threshold:
+                raise InsufficientSpeech()
+        elif self.speech_counter > self.max_speech_duration_threshold:
+            raise SpeechThresholdExceeded()
+        elif self.silence_counter > self.silence_threshold():
+            return True
+        return False
+
+    def _track(self, average: Optional[float], energy: float) -> float:
+        if average is None:
+            return energy
+        return average + self.ENERGY_ADAPTATION * (energy - average)
+
+
 class SpeechActivityDetection:
     def __init__(self, config: Config, interrupt_event: Event) -> None:
         self.interrupt_event = interrupt_event
-        self.vad = webrtcvad.Vad(config.sad.vad_mode)
-        self.silence_threshold = config.sad.silence_threshold
-        self.min_speech_duration_threshold = config.sad.min_speech_duration_threshold
-        self.max_speech_duration_threshold = config.sad.max_speech_duration_threshold
-        self.input_device_index = config.sad.input_device_index
-        self.frames_per_buffer = config.sad.frames_per_buffer
-        self.vad_sampling_rate = config.sad.vad_sampling_rate
+        self.vad = VAD_ENGINES[config.sad.vad_engine](config)
+        self.vad_batch = config.sad.vad_batch
+        self.endpointer = Endpointer(config)
+        self.end_padding = config.sad.end_padding
+        self.preroll_duration = config.source.preroll_duration
+        # frames are resampled by the capture bus to the rate of the vad
+        self.sampling_rate = config.sad.vad_sampling_rate
+        # the recording is handed to the stt as is, nothing resamples it
+        for stt in [config.stt, *(p.stt for p in (config.pipelines or {}).values())]:
+            if stt.sampling_rate != self.sampling_rate:
+                raise ValueError(
+                    f"stt {stt.yaml_tag} decodes {stt.sampling_rate} Hz, "
+                    f"but sad records at {self.sampling_rate} Hz"
+                )
+        frames_per_buffer = frame_size(config, self.sampling_rate)
+        preroll_frames = round(
+            self.preroll_duration / 1000 * self.sampling_rate / frames_per_buffer
+        )
+        self.frame_duration = frames_per_buffer / self.sampling_rate
+        # room for the pre-roll, the longest utterance and the silence ending it
+        self.recorded_speech = UtteranceBuffer(
+            preroll_frames
+            + self.endpointer.max_speech_duration_threshold
+            + self.endpointer.max_silence,
+            frames_per_buffer,
+        )
 
     def __call__(self, context: Dict, source: Callable) -> None:
         logger.debug(f"sad with source={source}")
-        with source(self.input_device_index, self.frames_per_buffer) as stream:
-            recorded_speech: Deque[bytes] = deque()
-
+        # the pre-roll covers the audio between the hotword and the subscription
+        with source(
+            "sad", self.preroll_duration, self.sampling_rate, context.get("start")
+        ) as stream:
+            recorded_speech = self.recorded_speech
+            recorded_speech.reset()
+            stt_stream = context.get("stt_stream")
+
+            # seed the utterance with the audio spoken before recording started,
+            # but after the hotword
+            for frames in stream.preroll():
+                if recorded_speech.is_full():
+                    break
+                recorded_speech.append(frames)
+                if stt_stream is not None:
+                    stt_stream.feed(frames)
+
+            stats = instrumentation.session("sad")
             try:
-                silence_counter = 0
-                speech_counter = 0
+                endpointer = self.endpointer
+                endpointer.reset()
+                pending = 0
+                end = None
 
                 for frames in stream.read():
                     if self.interrupt_event.is_set():
                         raise InterruptEvent()
+                    # a new wake word cancels the running session
+                    if "cancel" in context and context["cancel"].is_set():
+                        raise SessionCancelled()
 
+                    if recorded_speech.is_full():
+                        raise SpeechThresholdExceeded()
                     recorded_speech.append(frames)
-                    is_speech = self.vad.is_speech(frames, self.vad_sampling_rate)
-                    logger.debug(f"frame has {'speech' if is_speech else 'no speech'}")
-
-                    if is_speech:
-                        silence_counter = 0
-                        speech_counter += 1
-                        logger.debug(
-                            f"silence frame counter reseted\nspeech frame counter increased: {speech_counter}"
+                    if stt_stream is not None:
+                        stt_stream.feed(frames)
+
+                    # frames are classified in batches of vad_batch frames
+                    pending += 1
+                    if pending < self.vad_batch:
+                        continue
+                    start = len(recorded_speech) - pending
+                    pending = 0
+                    batch = recorded_speech.frames(start, len(recorded_speech))
+                    energies = np.mean(np.square(batch, dtype=np.float32), axis=1)
+                    if stats.enabled:
+                        started = time.perf_counter()
+                    decisions = self.vad(batch)
+                    if stats.enabled:
+                        elapsed = (time.perf_counter() - started) / len(batch)
+                        stats.observe("vad_time", elapsed)
+                        stats.observe("bus_lag", stream.lag())
+                    for index, (is_speech, energy) in enumerate(
+                        zip(decisions, energies), start=start
+                    ):
+                        stats.frame("speech" if is_speech else "silence")
+                        if endpointer(index, is_speech, float(energy)):
+                            end = index + 1
+                            break
+                    if end is not None:
+                        # the endpoint is only reached after speech
+                        last_speech = endpointer.last_speech
+                        assert last_speech is not None
+                        # cut right after the last speech frame plus padding
+                        recorded_speech.truncate(
+                            min(last_speech + 1 + self.end_padding, end)
                         )
-                    else:
-                        silence_counter += 1
-                        logger.debug(
-                            f"silence frame counter increased: {silence_counter}"
+                        latency = (end - last_speech - 1) * self.frame_duration
+                        context["endpoint_latency"] = latency
+                        stats.observe("endpoint_latency", latency)
+                        stats.observe(
+                            "silence_threshold", endpointer.silence_threshold()
                         )
+                        logger.info("endpoint after %.2f s of silence", latency)
+                        break
 
-                    if silence_counter > self.silence_threshold:
-                        if speech_counter > self.min_speech_duration_threshold:
-                            duration = len(recorded_speech) - (
-                                self.silence_threshold * 0.9
-                            )
-                            while len(recorded_speech) > duration:
-                                recorded_speech.pop()
-                            logger.debug("silence threshold exceeded")
-                            break
-                        else:
-                            raise InsufficientSpeech()
-                    elif speech_counter > self.max_speech_duration_threshold:
-                        raise SpeechThresholdExceeded()
-
-                context["frames"] = recorded_speech
+                context["frames"] = recorded_speech.view()
 
             except (
                 InterruptEvent,
+                SessionCancelled,
                 InsufficientSpeech,
                 SpeechThresholdExceeded,
             ) as err:
+                stats.count(type(err).__name__)
                 logger.error(type(err).__name__)
+            finally:
+                stats.count("frames", len(recorded_speech))
+                instrumentation.emit(stats)
@@ -1,6 +1,14 @@
+import json
 import logging
-from datetime import datetime
-from typing import Dict
+import socket
+import struct
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from queue import Queue
+from typing import Callable, Dict, List, Optional, Set, Tuple, Type, Union
 
 import deepspeech as ds
 import numpy as np
@@ -8,18 +16,194 @@ from pycommons.config.config import RESOURCES_DIRECTORY_PATH, Config
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+# engine owned by a SpeechToTextPool worker process
+_worker_engine: Optional["SpeechToText"] = None
 
-class DeepSpeech:
-    class DeepSpeechLogger:
+
+def _load_worker_engine(config: Config) -> None:
+    global _worker_engine
+    _worker_engine = create_engine(config)
+    _worker_engine.wait_loaded()
+
+
+def _worker_stt(audio: np.ndarray) -> Tuple[str, timedelta, float]:
+    engine = _worker_engine
+    if engine is None:
+        raise RuntimeError("stt worker has no engine loaded")
+    ts_start = datetime.now()
+    result = engine.transcribe(audio)
+    return (
+        result,
+        datetime.now() - ts_start,
+        len(audio) / engine.sampling_rate,
+    )
+
+
+def _noop() -> None:
+    pass
+
+
+class SpeechToTextMetrics:
+    """Load time, decode latency and real-time factor of an stt engine."""
+
+    def __init__(self, engine: str) -> None:
+        self.engine = engine
+        self.load_time: Optional[timedelta] = None
+        self.utterances = 0
+        self.audio_duration = 0.0
+        self.decode_time = timedelta()
+        self.latency = timedelta()
+        self.max_latency = timedelta()
+
+    def record(
+        self, audio_duration: float, latency: timedelta, decode_time: timedelta
+    ) -> None:
+        self.utterances += 1
+        self.audio_duration += audio_duration
+        self.decode_time += decode_time
+        self.latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def rtf(self) -> float:
+        if self.audio_duration == 0:
+            return 0.0
+        return self.decode_time.total_seconds() / self.audio_duration
+
+    def report(self) -> Dict:
+        return {
+            "engine": self.engine,
+            "load_time": (
+                None if self.load_time is None else self.load_time.total_seconds()
+            ),
+            "utterances": self.utterances,
+            "audio_duration": self.audio_duration,
+            "decode_time": self.decode_time.total_seconds(),
+            "latency_mean": (
+                self.latency.total_seconds() / self.utterances
+                if self.utterances > 0
+                else 0.0
+            ),
+            "latency_max": self.max_latency.total_seconds(),
+            "rtf": self.rtf,
+        }
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.report()})"
+
+
+class SpeechToTextStream(ABC):
+    """Feeds frames into an engine stream while they are recorded.
+
+    The engine stream is opened and decoded on a separate thread, so a slow
+    or busy model never stalls the caller, which is the speech activity
+    detection loop. When a partial
+    callback is set, the intermediate hypothesis is passed to it every
+    partial_interval samples as long as it changes, if the stream supports
+    partial results.
+    """
+
+    supports_partials = False
+
+    def __init__(self) -> None:
+        self._queue: Queue = Queue()
+        self.decode_time = timedelta()
+        self.on_partial: Optional[Callable[[str], None]] = None
+        self.partial_interval = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def feed(self, frames: bytes) -> None:
+        self._queue.put(frames)
+
+    def finish(self) -> str:
+        self._join()
+        ts_start = datetime.now()
+        result = self._finish()
+        self.decode_time += datetime.now() - ts_start
+        return result
+
+    def free(self) -> None:
+        self._join()
+        self._free()
+
+    @abstractmethod
+    def _feed(self, audio: np.ndarray) -> None:
+        pass
+
+    @abstractmethod
+    def _finish(self) -> str:
+        pass
+
+    def _open(self) -> None:
+        pass
+
+    def _free(self) -> None:
+        pass
+
+    def _intermediate(self) -> str:
+        raise NotImplementedError(f"{self.__class__.__name__} has no partial results")
+
+    def _join(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        # opened here, the caller may not wait for an engine busy elsewhere
+        self._open()
+        partial = ""
+        samples = 0
+        while True:
+            frames = self._queue.get()
+            if frames is None:
+                break
+            audio = np.frombuffer(frames, dtype=np.int16)
+            ts_start = datetime.now()
+            self._feed(audio)
+            self.decode_time += datetime.now() - ts_start
+
+            if self.on_partial is not None and self.partial_interval > 0:
+                samples += len(audio)
+                if samples >= self.partial_interval:
+                    samples = 0
+                    result = self._intermediate()
+                    if result != partial:
+                        partial = result
+                        self.on_partial(partial)
+
+
+class SpeechToText(ABC):
+    """Base class of the stt engines.
+
+    An engine loads its model in the background and warms it up, so the
+    service can listen for wake words right away. It only has to implement
+    loading and transcription, streaming is optional. An engine that does
+    not stream decodes the whole utterance at the end, even when streaming is
+    configured. Timing of every utterance is collected in the same metrics
+    for all engines.
+    """
+
+    supports_streaming = False
+
+    class SpeechToTextLogger:
         def __init__(self, config: Config) -> None:
+            self.logger: Optional[logging.Logger] = None
             if config.stt.logger.enable:
-                formatter = logging.Formatter(fmt=config.stt.logger.format)
-                file_handler = logging.FileHandler(config.stt.logger.file, mode="w")
-                file_handler.setFormatter(formatter)
-
-                self.logger: logging.Logger = logging.getLogger("DeepSpeechLogger")
+                # one logger per file, the stts of several pipelines log apart
+                self.logger = logging.getLogger(
+                    f"SpeechToTextLogger[{config.stt.logger.file}]"
+                )
                 self.logger.propagate = False
                 self.logger.setLevel(logging.DEBUG)
+                if self.logger.handlers:
+                    # another stt of the same config already writes the file
+                    return
+                formatter = logging.Formatter(fmt=config.stt.logger.format)
+                # delay opening so worker processes do not truncate the file
+                file_handler = logging.FileHandler(
+                    config.stt.logger.file, mode="w", delay=True
+                )
+                file_handler.setFormatter(formatter)
                 self.logger.addHandler(file_handler)
 
         def log(self, message: str) -> None:
@@ -27,24 +211,509 @@ class DeepSpeech:
                 self.logger.debug(message)
 
     def __init__(self, config: Config) -> None:
-        self._model: ds.Model = ds.Model(RESOURCES_DIRECTORY_PATH + config.stt.model)
-        self._model.enableExternalScorer(RESOURCES_DIRECTORY_PATH + config.stt.scorer)
+        self.streaming = config.stt.streaming and self.supports_streaming
+        if config.stt.streaming and not self.supports_streaming:
+            logger.warning(
+                f"{self.__class__.__name__} does not stream, "
+                "utterances are decoded at the end"
+            )
+        self.partial_interval = config.stt.partial_interval
+        self.metrics = SpeechToTextMetrics(self.__class__.__name__)
+        self.logger = self.SpeechToTextLogger(config)
 
-        self.logger = self.DeepSpeechLogger(config)
+        # models are loaded in the background so the service can listen at once
+        self._loaded = threading.Event()
+        self._load_error: Optional[Exception] = None
+        self._loader = threading.Thread(target=self._load, args=(config,), daemon=True)
+        self._loader.start()
 
     @property
+    @abstractmethod
     def sampling_rate(self) -> int:
-        return self._model.sampleRate()
+        pass
+
+    @abstractmethod
+    def load(self, config: Config) -> None:
+        pass
+
+    @abstractmethod
+    def transcribe(self, audio: np.ndarray) -> str:
+        pass
+
+    def open_stream(self) -> SpeechToTextStream:
+        raise NotImplementedError(f"{self.__class__.__name__} does not stream")
+
+    def warm_up(self) -> None:
+        # a short inference pages the model in before the first utterance
+        self.transcribe(np.zeros(self.sampling_rate // 2, dtype=np.int16))
+
+    def begin(self, context: Dict) -> None:
+        if self.streaming:
+            if not self._loaded.is_set():
+                logger.info("stt still loading, utterance is decoded at the end")
+                return
+            logger.debug("open stt stream")
+            stream = self.open_stream()
+            if "on_partial" in context and stream.supports_partials:
+                stream.partial_interval = int(
+                    self.partial_interval * self.sampling_rate
+                )
+                stream.on_partial = context["on_partial"]
+            context["stt_stream"] = stream
 
     def __call__(self, context: Dict):
+        stream: Optional[SpeechToTextStream] = context.pop("stt_stream", None)
         if "frames" in context:
             logger.info("preforming stt")
             ts_start = datetime.now()
-            result = self._model.stt(
-                np.frombuffer(
-                    np.concatenate(context["frames"], axis=None),
-                    dtype=np.int16,
-                )
+            self.wait_loaded()
+            if stream is not None:
+                result = stream.finish()
+                decode_time = stream.decode_time
+            else:
+                # waiting for the model to load is latency, not decode time
+                ts_decode = datetime.now()
+                result = self.transcribe(context["frames"])
+                decode_time = datetime.now() - ts_decode
+            latency = datetime.now() - ts_start
+            self.metrics.record(
+                len(context["frames"]) / self.sampling_rate, latency, decode_time
             )
-            self.logger.log(f"{datetime.now() - ts_start} {result}")
+            self.logger.log(f"{latency} {decode_time} {result}")
             context["command"] = result
+        elif stream is not None:
+            stream.free()
+
+    def report(self) -> Dict:
+        return self.metrics.report()
+
+    def shutdown(self) -> None:
+        pass
+
+    def wait_loaded(self) -> None:
+        if not self._loaded.is_set():
+            logger.info("waiting for stt to finish loading")
+            self._loaded.wait()
+        if self._load_error is not None:
+            raise self._load_error
+
+    def _load(self, config: Config) -> None:
+        ts_start = datetime.now()
+        try:
+            self.load(config)
+            self.warm_up()
+            self.metrics.load_time = datetime.now() - ts_start
+            logger.info(f"{self.metrics.engine} loaded in {self.metrics.load_time}")
+        except Exception as err:
+            logger.exception(f"loading {self.metrics.engine} failed")
+            self._load_error = err
+        finally:
+            self._loaded.set()
+
+
+class DeepSpeech(SpeechToText):
+    supports_streaming = True
+
+    class CommandRecognizer:
+        """Fast path for a fixed list of spoken commands.
+
+        Decodes with a narrow beam and boosts every command word. Without a
+        command scorer the general model is reused and its decoder switched
+        for each call, a small command scorer gets a model of its own. A
+        transcript is only accepted when it matches one of the commands and
+        its confidence clears the threshold, otherwise None is returned and
+        the caller falls back to the general model.
+        """
+
+        def __init__(
+            self, config: Config, model: ds.Model, lock: threading.Lock
+        ) -> None:
+            commands = config.stt.commands
+            self.phrases: Set[str] = {self._normalize(p) for p in commands.phrases}
+            self.words = {word for phrase in self.phrases for word in phrase.split()}
+            self.confidence_threshold = commands.confidence_threshold
+            self.beam_width = commands.beam_width
+            self.boost = commands.boost
+            self._lock = lock
+
+            # a second copy of the general scorer would double the memory
+            self._shared = commands.scorer is None
+            self.model = model
+            if commands.scorer is not None:
+                self.model = ds.Model(RESOURCES_DIRECTORY_PATH + config.stt.model)
+                self.model.enableExternalScorer(
+                    RESOURCES_DIRECTORY_PATH + commands.scorer
+                )
+                self._configure()
+
+        def __call__(self, audio: np.ndarray) -> Optional[str]:
+            with self._lock:
+                if self._shared:
+                    beam_width = self.model.beamWidth()
+                    self._configure()
+                    try:
+                        metadata = self.model.sttWithMetadata(audio, 1)
+                    finally:
+                        self.model.clearHotWords()
+                        self.model.setBeamWidth(beam_width)
+                else:
+                    metadata = self.model.sttWithMetadata(audio, 1)
+            transcript = metadata.transcripts[0]
+            result = self._normalize("".join(token.text for token in transcript.tokens))
+            logger.debug(f"command candidate '{result}' ({transcript.confidence:.2f})")
+            if (
+                result in self.phrases
+                and transcript.confidence >= self.confidence_threshold
+            ):
+                return result
+            return None
+
+        def _configure(self) -> None:
+            self.model.setBeamWidth(self.beam_width)
+            for word in self.words:
+                self.model.addHotWord(word, self.boost)
+
+        @staticmethod
+        def _normalize(phrase: str) -> str:
+            return " ".join(phrase.lower().split())
+
+    class DeepSpeechStream(SpeechToTextStream):
+        supports_partials = True
+
+        def __init__(self, model: ds.Model, lock: threading.Lock) -> None:
+            self._model = model
+            self._lock = lock
+            self._stream: ds.Stream
+            super().__init__()
+
+        def _open(self) -> None:
+            # a cancelled decode may still hold the model, recording goes on
+            # and its frames queue up meanwhile
+            with self._lock:
+                self._stream = self._model.createStream()
+
+        def _feed(self, audio: np.ndarray) -> None:
+            with self._lock:
+                self._stream.feedAudioContent(audio)
+
+        def _finish(self) -> str:
+            with self._lock:
+                return self._stream.finishStream()
+
+        def _free(self) -> None:
+            with self._lock:
+                self._stream.freeStream()
+
+        def _intermediate(self) -> str:
+            with self._lock:
+                return self._stream.intermediateDecode()
+
+    def __init__(self, config: Config) -> None:
+        self._model: ds.Model
+        # streams of a model share its interpreter, which is not thread safe;
+        # a cancelled decode may still run while the next session streams
+        self._lock = threading.Lock()
+        self._sampling_rate = config.stt.sampling_rate
+        self.commands: Optional[DeepSpeech.CommandRecognizer] = None
+        if config.stt.commands.enable and config.stt.streaming:
+            logger.warning("command fast path is disabled while streaming")
+        super().__init__(config)
+
+    @property
+    def sampling_rate(self) -> int:
+        return self._sampling_rate
+
+    def load(self, config: Config) -> None:
+        self._model = ds.Model(RESOURCES_DIRECTORY_PATH + config.stt.model)
+        if self._model.sampleRate() != self._sampling_rate:
+            raise ValueError(
+                f"{config.stt.model} decodes {self._model.sampleRate()} Hz, "
+                f"not the configured {self._sampling_rate} Hz"
+            )
+        self._model.enableExternalScorer(RESOURCES_DIRECTORY_PATH + config.stt.scorer)
+        self.configure_decoder(
+            config.stt.beam_width, config.stt.lm_alpha, config.stt.lm_beta
+        )
+        # streamed utterances are finished by the stream, not by transcribe
+        if config.stt.commands.enable and not config.stt.streaming:
+            self.commands = self.CommandRecognizer(config, self._model, self._lock)
+
+    def configure_decoder(
+        self,
+        beam_width: Optional[int],
+        lm_alpha: Optional[float],
+        lm_beta: Optional[float],
+    ) -> None:
+        """Overrides the decoder defaults of the model, None keeps a default."""
+        if beam_width is not None:
+            self._model.setBeamWidth(beam_width)
+        if lm_alpha is not None and lm_beta is not None:
+            self._model.setScorerAlphaBeta(lm_alpha, lm_beta)
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        result = None
+        if self.commands is not None:
+            result = self.commands(audio)
+        if result is None:
+            with self._lock:
+                result = self._model.stt(audio)
+        return result
+
+    def open_stream(self) -> SpeechToTextStream:
+        return self.DeepSpeechStream(self._model, self._lock)
+
+
+class Vosk(SpeechToText):
+    """Kaldi based engine of the vosk project, vosk is an optional dependency."""
+
+    supports_streaming = True
+
+    class VoskStream(SpeechToTextStream):
+        supports_partials = True
+
+        def __init__(self, recognizer) -> None:
+            # vosk ends a segment on every pause it detects on its own
+            self._recognizer = recognizer
+            self._segments: List[str] = []
+            super().__init__()
+
+        def _feed(self, audio: np.ndarray) -> None:
+            if self._recognizer.AcceptWaveform(audio.tobytes()):
+                self._segments.append(json.loads(self._recognizer.Result())["text"])
+
+        def _finish(self) -> str:
+            self._segments.append(json.loads(self._recognizer.FinalResult())["text"])
+            return " ".join(segment for segment in self._segments if segment)
+
+        def _intermediate(self) -> str:
+            partial = json.loads(self._recognizer.PartialResult())["partial"]
+            return " ".join(
+                segment for segment in self._segments + [partial] if segment
+            )
+
+    def __init__(self, config: Config) -> None:
+        self._sampling_rate = config.stt.sampling_rate
+        super().__init__(config)
+
+    @property
+    def sampling_rate(self) -> int:
+        return self._sampling_rate
+
+    def load(self, config: Config) -> None:
+        import vosk
+
+        self._vosk = vosk
+        self._model = vosk.Model(RESOURCES_DIRECTORY_PATH + config.stt.model)
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        stream = self.VoskStream(
+            self._vosk.KaldiRecognizer(self._model, self._sampling_rate)
+        )
+        stream.feed(audio.tobytes())
+        return stream.finish()
+
+    def open_stream(self) -> SpeechToTextStream:
+        return self.VoskStream(
+            self._vosk.KaldiRecognizer(self._model, self._sampling_rate)
+        )
+
+
+class SpeechToTextPool:
+    """Transcribes utterances in a pool of worker processes.
+
+    Every worker loads its own engine, so several utterances can be decoded
+    in parallel. Results are delivered through futures stored in the context
+    instead of blocking the caller.
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.workers = config.stt.workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_load_worker_engine,
+            initargs=(config,),
+        )
+        # fork all workers now, before the service starts its own threads
+        self._executor.submit(_noop)
+
+        self.metrics = SpeechToTextMetrics(
+            f"{STT_ENGINES[config.stt.yaml_tag].__name__} x {self.workers}"
+        )
+        self.logger = SpeechToText.SpeechToTextLogger(config)
+
+    def begin(self, context: Dict) -> None:
+        pass
+
+    def __call__(self, context: Dict):
+        if "frames" in context:
+            logger.info("submitting stt")
+            future: Future = Future()
+            # the frames are a view on a buffer that is reused by the next
+            # session, the executor pickles its arguments later on
+            self._executor.submit(
+                _worker_stt, context["frames"].copy()
+            ).add_done_callback(partial(self._done, context, future, datetime.now()))
+            context["future"] = future
+
+    def report(self) -> Dict:
+        return self.metrics.report()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def _done(
+        self, context: Dict, future: Future, ts_start: datetime, worker_future: Future
+    ) -> None:
+        try:
+            result, decode_time, audio_duration = worker_future.result()
+        except Exception as err:
+            future.set_exception(err)
+            return
+        latency = datetime.now() - ts_start
+        self.metrics.record(audio_duration, latency, decode_time)
+        self.logger.log(f"{latency} {decode_time} {result}")
+        context["command"] = result
+        future.set_result(result)
+
+
+# wire protocol of the stt daemon: a request is the sample count followed by
+# the raw little endian int16 samples, a response is the length of a json
+# document followed by the document
+HEADER = struct.Struct("!I")
+MAX_SAMPLES = 16000 * 60
+
+
+def receive_exactly(connection: socket.socket, size: int) -> bytearray:
+    data = bytearray(size)
+    view = memoryview(data)
+    while view:
+        received = connection.recv_into(view)
+        if received == 0:
+            raise ConnectionError("connection closed by peer")
+        view = view[received:]
+    return data
+
+
+def send_audio(connection: socket.socket, audio: np.ndarray) -> None:
+    audio = np.ascontiguousarray(audio, dtype="<i2")
+    connection.sendall(HEADER.pack(len(audio)))
+    connection.sendall(audio.data)
+
+
+def receive_audio(connection: socket.socket) -> np.ndarray:
+    (samples,) = HEADER.unpack(receive_exactly(connection, HEADER.size))
+    if samples > MAX_SAMPLES:
+        raise ValueError(f"request of {samples} samples exceeds {MAX_SAMPLES}")
+    return np.frombuffer(receive_exactly(connection, samples * 2), dtype="<i2")
+
+
+def send_json(connection: socket.socket, message: Dict) -> None:
+    document = json.dumps(message).encode("utf-8")
+    connection.sendall(HEADER.pack(len(document)) + document)
+
+
+def receive_json(connection: socket.socket) -> Dict:
+    (size,) = HEADER.unpack(receive_exactly(connection, HEADER.size))
+    return json.loads(receive_exactly(connection, size).decode("utf-8"))
+
+
+class SpeechToTextClient:
+    """Transcribes utterances with the stt daemon over a unix domain socket.
+
+    The daemon owns the only copy of the model, so the service process stays
+    small and decoding does not compete with the audio callback for the GIL.
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.socket_path = config.stt.socket
+        self.timeout = config.stt.timeout
+        self.sampling_rate = config.stt.sampling_rate
+        self._connection: Optional[socket.socket] = None
+
+        self.metrics = SpeechToTextMetrics(self.__class__.__name__)
+        self.logger = SpeechToText.SpeechToTextLogger(config)
+
+    def begin(self, context: Dict) -> None:
+        pass
+
+    def __call__(self, context: Dict):
+        if "frames" in context:
+            logger.info("requesting stt")
+            ts_start = datetime.now()
+            try:
+                response = self._request(context["frames"])
+            except (OSError, ValueError) as err:
+                logger.error(f"stt daemon request failed: {err}")
+                return
+            if "error" in response:
+                logger.error(f"stt daemon failed: {response['error']}")
+                return
+            latency = datetime.now() - ts_start
+            decode_time = timedelta(seconds=response["decode_time"])
+            self.metrics.record(
+                len(context["frames"]) / self.sampling_rate, latency, decode_time
+            )
+            self.logger.log(f"{latency} {decode_time} {response['command']}")
+            context["command"] = response["command"]
+
+    def report(self) -> Dict:
+        return self.metrics.report()
+
+    def shutdown(self) -> None:
+        self._close()
+
+    def _request(self, audio: np.ndarray) -> Dict:
+        # a broken connection is reopened once, the daemon may have restarted;
+        # once the request is sent it is never repeated, a resend after a
+        # timeout would decode the utterance twice
+        for attempt in range(2):
+            try:
+                connection = self._connect()
+                send_audio(connection, audio)
+                break
+            except ConnectionError:
+                self._close()
+                if attempt > 0:
+                    raise
+            except OSError:
+                self._close()
+                raise
+        try:
+            return receive_json(connection)
+        except OSError:
+            self._close()
+            raise
+
+    def _connect(self) -> socket.socket:
+        if self._connection is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            connection.connect(self.socket_path)
+            self._connection = connection
+        return self._connection
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+# engines by the yaml tag of their config
+STT_ENGINES: Dict[str, Type[SpeechToText]] = {
+    "!deepspeech": DeepSpeech,
+    "!vosk": Vosk,
+}
+
+
+def create_engine(config: Config) -> SpeechToText:
+    return STT_ENGINES[config.stt.yaml_tag](config)
+
+
+def create_stt(
+    config: Config,
+) -> Union[SpeechToText, SpeechToTextPool, SpeechToTextClient]:
+    if config.stt.yaml_tag == "!sttclient":
+        return SpeechToTextClient(config)
+    if config.stt.workers > 0:
+        return SpeechToTextPool(config)
+    return create_engine(config)
@@ -0,0 +1,91 @@
+import logging
+import os
+import signal
+import socketserver
+import threading
+from datetime import datetime
+from typing import Dict
+
+import numpy as np
+from pycommons.config.config import SttServerConfig, load_config
+
+from asr.asr.stt import create_stt, receive_audio, send_json
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class SpeechToTextServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves transcriptions of one shared stt engine over a unix socket.
+
+    Every connection may send any number of requests, see the wire protocol
+    in asr.asr.stt. In-process engines decode one request at a time, a pool
+    backend decodes requests of different connections in parallel.
+    """
+
+    daemon_threads = True
+
+    class RequestHandler(socketserver.BaseRequestHandler):
+        server: "SpeechToTextServer"
+
+        def handle(self) -> None:
+            logger.info("client connected")
+            while True:
+                try:
+                    audio = receive_audio(self.request)
+                except ConnectionError:
+                    break
+                except ValueError as err:
+                    send_json(self.request, {"error": str(err)})
+                    break
+                send_json(self.request, self.server.transcribe(audio))
+            logger.info("client disconnected")
+
+    def __init__(self, config: SttServerConfig) -> None:
+        self.stt = create_stt(config)
+        self._lock = threading.Lock()
+        self.socket_path: str = config.socket
+
+        if os.path.exists(config.socket):
+            os.remove(config.socket)
+        super().__init__(config.socket, self.RequestHandler)
+        logger.info(f"stt daemon listening on {config.socket}")
+
+    def transcribe(self, audio: np.ndarray) -> Dict:
+        context: Dict = {"frames": audio}
+        ts_start = datetime.now()
+        try:
+            with self._lock:
+                self.stt(context)
+            if "future" in context:
+                context["future"].result()
+        except Exception as err:
+            logger.exception("stt failed")
+            return {"error": str(err)}
+        return {
+            "command": context.get("command", ""),
+            "decode_time": (datetime.now() - ts_start).total_seconds(),
+        }
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.stt.shutdown()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+if __name__ == "__main__":
+    config: SttServerConfig = load_config("asr.yaml")["sttd"]
+    logger.debug(f"sttd config: {config}")
+    server = SpeechToTextServer(config)
+
+    def _signal_handler(signal_number, frame):
+        logger.info(f"signal: {signal_number}")
+        # shutdown blocks until serve_forever returns, so it must not run here
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGINT, _signal_handler)
+    signal.signal(signal.SIGTERM, _signal_handler)
+    server.serve_forever()
+    server.server_close()
+    logger.info(f"stt report: {server.stt.report()}")
+    logger.info("stt daemon stoped")
@@ -0,0 +1,159 @@
+import argparse
+import itertools
+import json
+import logging
+import re
+import time
+from typing import Dict, List
+
+import numpy as np
+from pycommons.config.config import CONFIGS_DIRECTORY_PATH, Config, load_config
+
+from asr.asr.corpus import Utterance, load_corpus, word_error_rate
+from asr.asr.stt import DeepSpeech
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+DECODER_SETTINGS = ("beam_width", "lm_alpha", "lm_beta")
+
+
+def sweep(
+    stt: DeepSpeech,
+    corpus: List[Utterance],
+    beam_widths: List[int],
+    alphas: List[float],
+    betas: List[float],
+) -> List[Dict]:
+    if all(utterance.transcript is None for utterance in corpus):
+        raise ValueError("corpus has no utterance with a reference transcript")
+    points = []
+    for beam_width, lm_alpha, lm_beta in itertools.product(beam_widths, alphas, betas):
+        stt.configure_decoder(beam_width, lm_alpha, lm_beta)
+        latencies = []
+        references = []
+        hypotheses = []
+        for utterance in corpus:
+            if utterance.transcript is None:
+                continue
+            ts_start = time.perf_counter()
+            hypotheses.append(stt.transcribe(utterance.audio))
+            latencies.append(time.perf_counter() - ts_start)
+            references.append(utterance.transcript)
+
+        point = {
+            "beam_width": beam_width,
+            "lm_alpha": lm_alpha,
+            "lm_beta": lm_beta,
+            "latency_mean": float(np.mean(latencies)),
+            "latency_p95": float(np.percentile(latencies, 95)),
+            "wer": word_error_rate(references, hypotheses),
+        }
+        logger.info(f"{point}")
+        points.append(point)
+    return points
+
+
+def pareto_front(points: List[Dict]) -> List[Dict]:
+    """Returns the points no other point beats in both latency and wer."""
+    front = [
+        point
+        for point in points
+        if not any(
+            other["latency_mean"] <= point["latency_mean"]
+            and other["wer"] <= point["wer"]
+            and (
+                other["latency_mean"] < point["latency_mean"]
+                or other["wer"] < point["wer"]
+            )
+            for other in points
+        )
+    ]
+    return sorted(front, key=lambda point: point["latency_mean"])
+
+
+def select(front: List[Dict], max_wer: float) -> Dict:
+    """Picks the fastest point meeting the accuracy target, else the most accurate."""
+    accurate = [point for point in front if point["wer"] <= max_wer]
+    if accurate:
+        return min(accurate, key=lambda point: point["latency_mean"])
+    logger.warning(f"no setting reaches a wer of {max_wer}, using the most accurate")
+    return min(front, key=lambda point: point["wer"])
+
+
+def write_decoder_settings(file_name: str, settings: Dict) -> None:
+    """Rewrites the decoder settings of the deepspeech section in place.
+
+    The file is edited line by line, so anchors, tags and the rest of the
+    configuration stay as they are.
+    """
+    path = CONFIGS_DIRECTORY_PATH + file_name
+    with open(path, "r") as config_file:
+        lines = config_file.read().split("\n")
+
+    in_section = False
+    pattern = re.compile(r"^  ({}):".format("|".join(DECODER_SETTINGS)))
+    for index, line in enumerate(lines):
+        if line and not line[0].isspace():
+            in_section = line.startswith("deepspeech:")
+        elif in_section:
+            match = pattern.match(line)
+            if match is not None:
+                lines[index] = f"  {match.group(1)}: {settings[match.group(1)]}"
+
+    with open(path, "w") as config_file:
+        config_file.write("\n".join(lines))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Sweeps beam width and scorer alpha/beta of deepspeech over "
+        "a labelled corpus and picks the fastest setting meeting a wer target"
+    )
+    parser.add_argument("corpus", help="folder of 16 kHz wav files with transcripts")
+    parser.add_argument("--config", default="asr.yaml", help="asr config file")
+    parser.add_argument(
+        "--beam-widths", type=int, nargs="+", default=[50, 100, 250, 500, 1024]
+    )
+    parser.add_argument(
+        "--alphas", type=float, nargs="+", default=[0.5, 0.75, 0.93, 1.2]
+    )
+    parser.add_argument("--betas", type=float, nargs="+", default=[0.5, 1.18, 2.0])
+    parser.add_argument("--max-wer", type=float, default=0.1, help="accuracy target")
+    parser.add_argument(
+        "--write", action="store_true", help="write the selection to the config"
+    )
+    parser.add_argument("--output", help="write the report to this file")
+    args = parser.parse_args()
+
+    config: Config = load_config(args.config)["asr"]
+    # the general decoder is tuned, not the command fast path
+    config.stt.commands.enable = False
+    stt = DeepSpeech(config)
+    stt.wait_loaded()
+
+    corpus = [
+        utterance
+        for utterance in load_corpus(args.corpus, stt.sampling_rate)
+        if utterance.transcript is not None
+    ]
+    if not corpus:
+        parser.error(f"no wav file in {args.corpus} has a reference transcript")
+    points = sweep(stt, corpus, args.beam_widths, args.alphas, args.betas)
+    front = pareto_front(points)
+    selection = select(front, args.max_wer)
+    if args.write:
+        write_decoder_settings(args.config, selection)
+        logger.info(f"wrote {selection} to {args.config}")
+
+    report = json.dumps(
+        {"selection": selection, "pareto_front": front, "points": points}, indent=2
+    )
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w") as output:
+            output.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import logging
+from typing import Dict, Type, Union
+
+import numpy as np
+import webrtcvad
+from pycommons.audio.processing import frame_size
+from pycommons.config.config import Config
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class WebRtcVad:
+    """Classifies frames one by one with the webrtc voice activity detector."""
+
+    def __init__(self, config: Config) -> None:
+        self.vad = webrtcvad.Vad(config.sad.vad_mode)
+        self.vad_sampling_rate = config.sad.vad_sampling_rate
+
+    def __call__(self, frames: np.ndarray) -> np.ndarray:
+        return np.array(
+            [
+                self.vad.is_speech(frame.tobytes(), self.vad_sampling_rate)
+                for frame in frames
+            ],
+            dtype=bool,
+        )
+
+
+class SpectralVad:
+    """Classifies a batch of frames with one vectorized pass over their spectra.
+
+    A frame is speech when its energy is a margin above the tracked noise
+    floor, most of it lies in the speech band and its spectrum in that band
+    is not flat like noise. Higher vad modes demand a larger margin.
+    """
+
+    MARGINS_DB = (3.0, 6.0, 9.0, 12.0)
+    MIN_ENERGY_DB = -70.0
+    SPEECH_BAND = (100.0, 4000.0)
+    BAND_RATIO_THRESHOLD = 0.5
+    FLATNESS_THRESHOLD = 0.35
+    # how fast the noise floor follows frames classified as noise
+    NOISE_ADAPTATION = 0.05
+
+    def __init__(self, config: Config) -> None:
+        size = frame_size(config, config.sad.vad_sampling_rate)
+        self.margin_db = self.MARGINS_DB[config.sad.vad_mode]
+        self.window = np.hanning(size).astype(np.float32) / 32768
+        frequencies = np.fft.rfftfreq(size, 1 / config.sad.vad_sampling_rate)
+        self.band = (frequencies >= self.SPEECH_BAND[0]) & (
+            frequencies <= self.SPEECH_BAND[1]
+        )
+        self.noise_floor_db: Union[float, None] = None
+
+    def __call__(self, frames: np.ndarray) -> np.ndarray:
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2 + 1e-12
+        total = power.sum(axis=1)
+        band = power[:, self.band]
+        energy_db = 10 * np.log10(total)
+        band_ratio = band.sum(axis=1) / total
+        flatness = np.exp(np.log(band).mean(axis=1)) / band.mean(axis=1)
+
+        if self.noise_floor_db is None:
+            self.noise_floor_db = float(energy_db.min())
+        speech = (
+            (energy_db > self.noise_floor_db + self.margin_db)
+            & (energy_db > self.MIN_ENERGY_DB)
+            & (band_ratio > self.BAND_RATIO_THRESHOLD)
+            & (flatness < self.FLATNESS_THRESHOLD)
+        )
+
+        # falls at once with quieter frames, rises slowly with noise frames
+        noise = energy_db[~speech]
+        if noise.size > 0:
+            self.noise_floor_db += self.NOISE_ADAPTATION * (
+                float(noise.mean()) - self.noise_floor_db
+            )
+        self.noise_floor_db = min(self.noise_floor_db, float(energy_db.min()))
+        return speech
+
+
+VAD_ENGINES: Dict[str, Type[Union[WebRtcVad, SpectralVad]]] = {
+    "webrtc": WebRtcVad,
+    "spectral": SpectralVad,
+}
@@ -0,0 +1,164 @@
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+from pycommons.audio.processing import frame_size
+from pycommons.config.config import Config
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class DelayAndSum:
+    """Frequency domain delay-and-sum beamformer for a planar microphone array.
+
+    Frames are transformed with a short-time fourier transform of twice the
+    frame size and a square root hann window, so the output is rebuilt by
+    overlap-add and lags one frame behind the input. The direction of
+    arrival is found with SRP-PHAT on a grid of azimuths and only updated on
+    frames clearly above the noise floor; the channels are then phase
+    aligned for that direction and averaged.
+
+    Processing time is kept below budget milliseconds per 10 ms of audio.
+    Above it the direction is searched less often, and if that is not
+    enough the beamformer falls back to a plain downmix.
+    """
+
+    SPEED_OF_SOUND = 343.0
+    DIRECTIONS = 36
+    DOA_BAND = (300.0, 3500.0)
+    # weight of the previous steered response power map when adding a frame
+    DOA_SMOOTHING = 0.9
+    # energy above the noise floor a frame needs to update the direction
+    DOA_MARGIN = 4.0
+    MAX_DOA_INTERVAL = 16
+    BUDGET_CHECK_FRAMES = 100
+
+    def __init__(self, config: Config) -> None:
+        positions = np.asarray(config.source.mic_positions, dtype=np.float64)
+        self.channels = config.source.channels
+        if positions.shape != (self.channels, 2):
+            raise ValueError(
+                f"mic_positions needs an x, y position for each of the "
+                f"{self.channels} channels"
+            )
+        sampling_rate = config.source.sampling_rate
+        self.frame_size = frame_size(config, sampling_rate)
+        fft_size = 2 * self.frame_size
+        # periodic square root hann windows sum to one at half overlap
+        self.window = np.sqrt(np.hanning(fft_size + 1)[:-1]).astype(np.float32)
+        frequencies = np.fft.rfftfreq(fft_size, 1 / sampling_rate)
+        self.band = (frequencies >= self.DOA_BAND[0]) & (
+            frequencies <= self.DOA_BAND[1]
+        )
+
+        azimuths = np.arange(self.DIRECTIONS) * 2 * np.pi / self.DIRECTIONS
+        self.azimuths = np.degrees(azimuths)
+        directions = np.stack((np.cos(azimuths), np.sin(azimuths)), axis=1)
+        # a microphone closer to the source receives the wave earlier
+        advances = directions @ positions.T / self.SPEED_OF_SOUND
+        self.steering = np.exp(
+            -2j * np.pi * advances[:, :, None] * frequencies[None, None, :]
+        ).astype(np.complex64)
+
+        self.budget = (
+            config.source.beamform_budget * self.frame_size / sampling_rate * 100
+        )
+        self.direction = 0
+        self.doa_interval = 1
+        self.downmix = False
+        self._power = np.zeros(self.DIRECTIONS, dtype=np.float32)
+        self._noise_floor: Optional[float] = None
+        self._previous = np.zeros((self.channels, self.frame_size), dtype=np.float32)
+        self._tail: np.ndarray = np.zeros(self.frame_size, dtype=np.float32)
+        self._count = 0
+        self._measured = 0
+        self._elapsed = 0.0
+
+    def __call__(self, frames: bytes) -> np.ndarray:
+        """Beamforms one or more frames, read in one go from the source."""
+        started = time.perf_counter()
+        samples = (
+            np.frombuffer(frames, dtype=np.int16)
+            .reshape(-1, self.channels)
+            .T.astype(np.float32)
+        )
+        count = samples.shape[1] // self.frame_size
+        if self.downmix:
+            output = samples.mean(axis=0)
+        else:
+            output = np.concatenate(
+                [
+                    self._beamform(samples[:, start : start + self.frame_size])
+                    for start in range(0, samples.shape[1], self.frame_size)
+                ]
+            )
+        self._account(time.perf_counter() - started, count)
+        return output
+
+    def _beamform(self, samples: np.ndarray) -> np.ndarray:
+        block = np.concatenate((self._previous, samples), axis=1)
+        self._previous = samples
+        spectrum = np.fft.rfft(block * self.window, axis=1)
+
+        if self._count % self.doa_interval == 0:
+            self._locate(spectrum)
+        self._count += 1
+
+        aligned = np.einsum("mf,mf->f", spectrum, self.steering[self.direction])
+        output = np.fft.irfft(aligned / self.channels) * self.window
+        result = self._tail + output[: self.frame_size]
+        self._tail = output[self.frame_size :]
+        return result
+
+    def _locate(self, spectrum: np.ndarray) -> None:
+        band = spectrum[:, self.band]
+        energy = float(np.mean(np.abs(band) ** 2))
+        if self._noise_floor is None or energy < self._noise_floor:
+            self._noise_floor = energy
+        else:
+            # the floor creeps up so it recovers from a quiet start
+            self._noise_floor *= 1.001
+        if energy < self.DOA_MARGIN * self._noise_floor:
+            return
+
+        phat = band / (np.abs(band) + 1e-9)
+        response = np.einsum("dmf,mf->df", self.steering[:, :, self.band], phat)
+        power = (np.abs(response) ** 2).sum(axis=1)
+        self._power = self.DOA_SMOOTHING * self._power + power
+        direction = int(np.argmax(self._power))
+        if direction != self.direction:
+            logger.debug("direction of arrival %.0f degrees", self.azimuths[direction])
+            self.direction = direction
+
+    def _account(self, elapsed: float, count: int) -> None:
+        self._elapsed += elapsed
+        self._measured += count
+        if self._measured < self.BUDGET_CHECK_FRAMES:
+            return
+        average = self._elapsed / self._measured * 1000
+        self._elapsed = 0.0
+        self._measured = 0
+        if average <= self.budget or self.downmix:
+            return
+        if self.doa_interval < self.MAX_DOA_INTERVAL:
+            self.doa_interval *= 2
+            logger.warning(
+                f"beamformer took {average:.3f} ms per frame, over budget of "
+                f"{self.budget:.3f} ms, direction search every "
+                f"{self.doa_interval} frames"
+            )
+        else:
+            self.downmix = True
+            logger.warning(
+                f"beamformer took {average:.3f} ms per frame, over budget of "
+                f"{self.budget:.3f} ms, falling back to downmix"
+            )
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(channels={self.channels}, "
+            f"frame_size={self.frame_size}, budget={self.budget}, "
+            f"direction={self.azimuths[self.direction]:.0f}, "
+            f"doa_interval={self.doa_interval}, downmix={self.downmix}"
+        )
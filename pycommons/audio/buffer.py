@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class UtteranceBuffer:
+    """Preallocated int16 buffer that collects the frames of one utterance.
+
+    The buffer is reused for every session, so recording does not allocate
+    per frame and consumers get a view instead of a copy. A view is only
+    valid until the buffer is reset for the next utterance.
+    """
+
+    def __init__(self, capacity: int, frame_size: int) -> None:
+        self.frame_size = frame_size
+        self._data = np.zeros(capacity * frame_size, dtype=np.int16)
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length // self.frame_size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data) // self.frame_size
+
+    def is_full(self) -> bool:
+        return self._length + self.frame_size > len(self._data)
+
+    def append(self, frames: bytes) -> None:
+        samples = np.frombuffer(frames, dtype=np.int16)
+        end = self._length + len(samples)
+        if end > len(self._data):
+            raise BufferError("utterance buffer is full")
+        self._data[self._length : end] = samples
+        self._length = end
+
+    def truncate(self, frames: int) -> None:
+        self._length = min(self._length, max(frames, 0) * self.frame_size)
+
+    def reset(self) -> None:
+        self._length = 0
+
+    def view(self) -> np.ndarray:
+        return self._data[: self._length]
+
+    def frames(self, start: int, end: int) -> np.ndarray:
+        """Returns a view on the frames [start, end) with one frame per row."""
+        return self._data[start * self.frame_size : end * self.frame_size].reshape(
+            -1, self.frame_size
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(frames={len(self)}, "
+            f"capacity={self.capacity}, frame_size={self.frame_size})"
+        )
@@ -0,0 +1,318 @@
+import logging
+import threading
+from collections import deque
+from types import TracebackType
+from typing import Deque, Dict, Generator, List, Optional, Set, Type, Union
+
+from pycommons.audio.beamformer import DelayAndSum
+from pycommons.audio.processing import (
+    ChannelMixer,
+    PolyphaseResampler,
+    Reframer,
+    frame_size,
+)
+from pycommons.config.config import Config
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Read cursor of one consumer on the capture bus.
+
+    A subscription yields every frame published after it was created, in
+    order and independent of the other subscribers. Frames published before
+    are available through preroll, up to the lookback asked for.
+    """
+
+    def __init__(
+        self,
+        bus: "CaptureBus",
+        name: str,
+        channel: "_Channel",
+        cursor: int,
+        preroll: List[bytes],
+    ) -> None:
+        self.name = name
+        self.rate = channel.rate
+        self.cursor = cursor
+        self.dropped = 0
+        self.active = True
+        self._bus = bus
+        self._channel = channel
+        self._preroll = preroll
+
+    def read(self) -> Generator[bytes, None, None]:
+        logger.info(f"begin reading bus as {self.name}")
+        while True:
+            frames = self._bus._next(self)
+            if frames is None:
+                break
+            yield frames
+        logger.info(f"finished reading bus as {self.name}")
+
+    def position(self) -> float:
+        """Returns the capture position of the next frame to read.
+
+        Positions count frames of the source since the capture started, so
+        they compare across subscribers of different rates.
+        """
+        return self._channel.origin + self.cursor
+
+    def lag(self) -> int:
+        """Returns the number of published frames not read yet."""
+        return self._channel.first + len(self._channel.history) - self.cursor
+
+    def preroll(self) -> List[bytes]:
+        """Returns the frames captured before the subscription, see __call__."""
+        return self._preroll
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ):
+        self._bus._unsubscribe(self)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(name={self.name}, rate={self.rate}, "
+            f"cursor={self.cursor}, dropped={self.dropped}"
+        )
+
+
+class _Channel:
+    """Mono frames at one sampling rate with the history kept for them."""
+
+    def __init__(self, config: Config, rate: int, history: int, origin: float) -> None:
+        self.rate = rate
+        # capture position of the first frame of this rate
+        self.origin = origin
+        self.resample = PolyphaseResampler(config.source.sampling_rate, rate)
+        self.reframe = Reframer(frame_size(config, rate))
+        self.history: Deque[bytes] = deque(maxlen=history)
+        # sequence number of the oldest frame in the history
+        self.first = 0
+
+    def publish(self, samples) -> None:
+        for frames in self.reframe(self.resample(samples)):
+            if len(self.history) == self.history.maxlen:
+                self.first += 1
+            self.history.append(frames)
+
+
+class CaptureBus:
+    """Owns the audio source and fans its frames out to subscribers.
+
+    A capture thread opens the source once and keeps reading it for the
+    lifetime of the service, so the device is never reopened on a state
+    change. The source may deliver several interleaved channels at its
+    native rate, they are turned into one channel as configured by
+    channel_mode, by a beamformer in beamform mode, and resampled to the
+    rate every subscriber asks for.
+
+    Frames of each rate are kept in a history of history_duration
+    milliseconds and numbered in capture order; every subscriber reads the
+    history with its own cursor. A subscriber falling further behind than
+    the history loses the oldest frames, it never blocks the capture thread.
+
+    A source that is not live, like a replayed file, is read no faster than
+    the subscribers: the capture thread waits for a subscriber, for every
+    expected subscriber and for every subscriber to read all published
+    frames before it publishes more.
+    """
+
+    def __init__(self, config: Config, source) -> None:
+        self.config = config
+        self.source = source
+        self.live = source.live
+        sampling_rate = config.source.sampling_rate
+        self.frame_duration = frame_size(config, sampling_rate) / sampling_rate * 1000
+        self.mix: Union[ChannelMixer, DelayAndSum]
+        if config.source.channel_mode == "beamform":
+            self.mix = DelayAndSum(config)
+        else:
+            self.mix = ChannelMixer(
+                config.source.channels,
+                config.source.channel_mode,
+                config.source.channel,
+            )
+        self._history = self.frames(config.source.history_duration)
+        self._channels: Dict[int, _Channel] = {}
+        self._frame_size = frame_size(config, sampling_rate)
+        # frames of the source captured so far
+        self._captured = 0.0
+        # subscribers a source that is not live waits for, see expect
+        self._expected: Set[str] = set()
+        self._condition = threading.Condition()
+        self._subscribers: Dict[str, Subscription] = {}
+        self._running = threading.Event()
+        self._stream = None
+        # set when the source failed, the capture is stopped then
+        self.error: Optional[Exception] = None
+        self._thread = threading.Thread(
+            target=self._capture, name="capture-bus", daemon=True
+        )
+
+    def frames(self, duration: float) -> int:
+        """Returns the number of frames covering duration milliseconds."""
+        return max(round(duration / self.frame_duration), 1)
+
+    @property
+    def running(self) -> bool:
+        """False once closed, once the source has no more frames or failed."""
+        return self._running.is_set()
+
+    def start(self) -> "CaptureBus":
+        self._running.set()
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        logger.info("close capture bus")
+        self._running.clear()
+        # wakes subscribers and a capture thread waiting for them
+        with self._condition:
+            self._condition.notify_all()
+        if self._stream is not None:
+            self._stream.stop()
+        self._thread.join()
+
+    def __call__(
+        self,
+        name: str,
+        lookback: float = 0,
+        rate: Optional[int] = None,
+        start: Optional[float] = None,
+    ) -> Subscription:
+        """Subscribes to the frames published from now on.
+
+        lookback is the duration in milliseconds of already captured audio
+        to hand out as pre-roll. Given a capture position as start, the
+        pre-roll only holds the frames from start on, still limited to
+        lookback. Frames are resampled to rate, by default they keep the
+        rate of the source. The history of a rate starts with its first
+        subscriber, before that there is no pre-roll for it.
+        """
+        rate = self.config.source.sampling_rate if rate is None else rate
+        with self._condition:
+            if rate not in self._channels:
+                logger.info(f"capture bus channel at {rate} Hz opened")
+                self._channels[rate] = _Channel(
+                    self.config, rate, self._history, self._captured
+                )
+            channel = self._channels[rate]
+            history = channel.history
+            cursor = channel.first + len(history)
+            count = min(self.frames(lookback), len(history)) if lookback else 0
+            if start is not None:
+                count = min(count, max(cursor - round(start - channel.origin), 0))
+            preroll = list(history)[len(history) - count :]
+            subscription = Subscription(self, name, channel, cursor, preroll)
+            if name in self._subscribers:
+                logger.warning(f"subscriber {name} replaced")
+                self._subscribers[name].active = False
+            self._subscribers[name] = subscription
+            self._expected.discard(name)
+            self._condition.notify_all()
+        logger.debug(f"subscribed {subscription}")
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._condition:
+            subscription.active = False
+            if self._subscribers.get(subscription.name) is subscription:
+                del self._subscribers[subscription.name]
+            self._condition.notify_all()
+        logger.debug(f"unsubscribed {subscription}")
+
+    def _next(self, subscription: Subscription) -> Optional[bytes]:
+        channel = subscription._channel
+        with self._condition:
+            while subscription.active:
+                if subscription.cursor < channel.first:
+                    dropped = channel.first - subscription.cursor
+                    subscription.dropped += dropped
+                    subscription.cursor = channel.first
+                    logger.warning(
+                        "subscriber %s overrun, %d frames dropped",
+                        subscription.name,
+                        dropped,
+                    )
+                index = subscription.cursor - channel.first
+                if index < len(channel.history):
+                    subscription.cursor += 1
+                    if not self.live and index + 1 == len(channel.history):
+                        # the capture thread may wait for this subscriber
+                        self._condition.notify_all()
+                    return channel.history[index]
+                if not self._running.is_set():
+                    # frames published before the capture stopped are still read
+                    break
+                self._condition.wait(timeout=1)
+            return None
+
+    def expect(self, name: str) -> None:
+        """Holds back a source that is not live until name subscribes.
+
+        Without it, a replay runs on as fast as the remaining subscribers
+        read while the next one is about to subscribe. A subscriber of that
+        name that is still subscribed keeps reading meanwhile.
+        """
+        if self.live:
+            return
+        with self._condition:
+            self._expected.add(name)
+
+    def _wait_subscribers(self) -> None:
+        while self._running.is_set() and (
+            not self._subscribers
+            or any(name not in self._subscribers for name in self._expected)
+            or any(subscription.lag() for subscription in self._subscribers.values())
+        ):
+            self._condition.wait(timeout=1)
+
+    def _capture(self) -> None:
+        logger.info("capture bus started")
+        try:
+            while True:
+                with self.source() as stream:
+                    self._stream = stream
+                    for frames in stream.read():
+                        if not self._running.is_set():
+                            break
+                        # channels are mixed once, resampling is done per
+                        # rate; mixing copies the frames, a view from the
+                        # source may be reused
+                        samples = self.mix(frames)
+                        with self._condition:
+                            if not self.live:
+                                self._wait_subscribers()
+                            for channel in self._channels.values():
+                                channel.publish(samples)
+                            self._captured += len(samples) / self._frame_size
+                            self._condition.notify_all()
+                self._stream = None
+                # a microphone ends its read to pick up changed devices
+                if not self._running.is_set() or not getattr(stream, "reopen", False):
+                    break
+                logger.info("reopen capture source")
+        except Exception as error:
+            logger.exception("capture bus failed")
+            self.error = error
+        finally:
+            # subscribers waiting for frames must see the end of the capture
+            self._running.clear()
+            with self._condition:
+                self._condition.notify_all()
+        logger.info("capture bus stopped")
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(source={self.source}, live={self.live}, "
+            f"history={self._history}, rates={list(self._channels)}, "
+            f"subscribers={list(self._subscribers)}"
+        )
@@ -0,0 +1,141 @@
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+import pyaudio
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class DeviceRegistry:
+    """Shared PortAudio instance with a cache of the device infos.
+
+    PortAudio enumerates the devices when it is initialized, which takes a
+    while on alsa. The registry initializes it once, on first use, and every
+    lookup and stream open reuses the cached infos and the same instance.
+
+    When pyudev is installed, a change in the sound subsystem marks the cache
+    stale. PortAudio only rescans on a new initialization, so the instance is
+    recreated on the next lookup, but only while no stream holds it. An open
+    Microphone therefore ends its read when the cache is stale, the capture
+    bus reopens it and the reopen rescans the devices.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._source: Optional[pyaudio.PyAudio] = None
+        self._devices: List[Dict] = []
+        self._users = 0
+        self._stale = False
+        # a pyudev.MonitorObserver, pyudev is optional
+        self._observer: Optional[Any] = None
+        self._watched = False
+
+    def _probe(self) -> None:
+        if self._source is not None:
+            self._source.terminate()
+        self._source = pyaudio.PyAudio()
+        self._devices = [
+            self._source.get_device_info_by_index(index)
+            for index in range(self._source.get_device_count())
+        ]
+        self._stale = False
+        logger.info("found %d audio devices", len(self._devices))
+        if not self._watched:
+            self._watch()
+
+    def _watch(self) -> None:
+        self._watched = True
+        try:
+            import pyudev
+        except ImportError:
+            logger.info("pyudev not installed, audio devices are not refreshed")
+            return
+        monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        monitor.filter_by(subsystem="sound")
+        self._observer = pyudev.MonitorObserver(monitor, callback=self._on_change)
+        self._observer.daemon = True
+        self._observer.start()
+
+    def _on_change(self, device) -> None:
+        logger.info("sound device %s %s", device.action, device.sys_name)
+        self._stale = True
+
+    @property
+    def stale(self) -> bool:
+        """True when the devices changed since they were enumerated."""
+        return self._stale
+
+    def _ensure(self) -> None:
+        if self._source is None or (self._stale and self._users == 0):
+            self._probe()
+
+    def devices(self) -> List[Dict]:
+        with self._lock:
+            self._ensure()
+            return list(self._devices)
+
+    def input_devices(self) -> List[Dict]:
+        return [info for info in self.devices() if info["maxInputChannels"] > 0]
+
+    def find(self, name: str) -> Optional[Dict]:
+        """Returns the input device called name, else the first one it matches.
+
+        name is used as a regular expression searched in the device names.
+        """
+        devices = self.input_devices()
+        for info in devices:
+            if info["name"] == name:
+                return info
+        try:
+            pattern = re.compile(name)
+        except re.error:
+            return None
+        for info in devices:
+            if pattern.search(info["name"]):
+                return info
+        return None
+
+    def resolve(self, device: Union[int, str, None]) -> Optional[int]:
+        """Returns the index of a device given by index, name or pattern.
+
+        None stands for the default input device and is passed on as is.
+        """
+        if device is None or isinstance(device, int):
+            return device
+        info = self.find(device)
+        if info is None:
+            names = [info["name"] for info in self.input_devices()]
+            raise ValueError(f"no input device matches {device}, found {names}")
+        return info["index"]
+
+    def acquire(self) -> pyaudio.PyAudio:
+        """Returns the shared instance to open a stream on, see release."""
+        with self._lock:
+            self._ensure()
+            self._users += 1
+            return self._source
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+
+    def terminate(self) -> None:
+        with self._lock:
+            if self._observer is not None:
+                self._observer.stop()
+            self._observer = None
+            self._watched = False
+            if self._source is not None:
+                self._source.terminate()
+            self._source = None
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(devices={len(self._devices)}, "
+            f"users={self._users}, stale={self._stale}"
+        )
+
+
+registry = DeviceRegistry()
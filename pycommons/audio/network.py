@@ -0,0 +1,378 @@
+import argparse
+import logging
+import signal
+import socket
+import struct
+import threading
+import time
+from types import TracebackType
+from typing import Dict, Generator, Optional, Tuple, Type
+
+import numpy as np
+from pycommons.audio.processing import frame_size
+from pycommons.config.config import Config, load_config
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# codec, sequence number, capture time in seconds and the adpcm state the
+# payload starts with, so every packet decodes on its own
+HEADER = struct.Struct("!BIdhB")
+MAX_PACKET = 65535
+# DSCP expedited forwarding, wifi access points map it to the voice queue
+TOS_EXPEDITED_FORWARDING = 0xB8
+
+
+def _mulaw_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """Returns G.711 mu-law tables indexed by uint16 sample and by code."""
+    bias = 0x84
+    samples = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)
+    # quantized to 14 bits first, like the reference implementation
+    magnitude = (np.minimum(np.abs(samples >> 2), 8158) << 2) + bias
+    exponent = np.frexp(magnitude)[1] - 8
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    sign = (samples < 0).astype(np.int32) << 7
+    encode = (~(sign | exponent << 4 | mantissa) & 0xFF).astype(np.uint8)
+
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    magnitude = (((codes & 0x0F) << 3) + bias << exponent) - bias
+    decode = np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+    return encode, decode
+
+
+class Codec:
+    """Plain int16 pcm, the base of the codecs.
+
+    encode returns the payload and the state a decoder needs to start on it,
+    the state is sent in the packet header.
+    """
+
+    ID = 0
+
+    def __init__(self, channels: int) -> None:
+        self.channels = channels
+
+    def encode(self, frames: bytes) -> Tuple[bytes, Tuple[int, int]]:
+        return bytes(frames), (0, 0)
+
+    def decode(self, payload: bytes, state: Tuple[int, int]) -> bytes:
+        return payload
+
+
+class MuLaw(Codec):
+    """G.711 mu-law, 8 bits per sample."""
+
+    ID = 1
+    ENCODE, DECODE = _mulaw_tables()
+
+    def encode(self, frames: bytes) -> Tuple[bytes, Tuple[int, int]]:
+        return self.ENCODE[np.frombuffer(frames, dtype=np.uint16)].tobytes(), (0, 0)
+
+    def decode(self, payload: bytes, state: Tuple[int, int]) -> bytes:
+        return self.DECODE[np.frombuffer(payload, dtype=np.uint8)].tobytes()
+
+
+class Adpcm(Codec):
+    """IMA ADPCM of audioop, 4 bits per sample, mono only.
+
+    The encoder runs on across packets and every packet carries the state
+    it starts with, so a lost packet does not corrupt the next ones.
+    """
+
+    ID = 2
+
+    def __init__(self, channels: int) -> None:
+        if channels != 1:
+            raise ValueError("adpcm only encodes a single channel")
+        super().__init__(channels)
+        import audioop
+
+        self._audioop = audioop
+        self._state: Optional[Tuple[int, int]] = None
+
+    def encode(self, frames: bytes) -> Tuple[bytes, Tuple[int, int]]:
+        state = self._state or (0, 0)
+        payload, self._state = self._audioop.lin2adpcm(frames, 2, self._state)
+        return payload, state
+
+    def decode(self, payload: bytes, state: Tuple[int, int]) -> bytes:
+        return self._audioop.adpcm2lin(payload, 2, state)[0]
+
+
+CODECS: Dict[str, Type[Codec]] = {
+    "pcm": Codec,
+    "mulaw": MuLaw,
+    "adpcm": Adpcm,
+}
+
+
+class NetworkSender:
+    """Sends frames of a local source to a NetworkSource, one per packet."""
+
+    def __init__(self, config: Config, host: str) -> None:
+        self.address = (host, config.source.port)
+        self.codec = CODECS[config.source.codec](config.source.channels)
+        frames_per_buffer = frame_size(config, config.source.sampling_rate)
+        self.frame_duration = frames_per_buffer / config.source.sampling_rate
+        # only int16 samples are supported
+        self.frame_bytes = frames_per_buffer * config.source.channels * 2
+        self.sequence = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(
+            socket.IPPROTO_IP, socket.IP_TOS, TOS_EXPEDITED_FORWARDING
+        )
+
+    def __call__(self, frames: bytes) -> None:
+        """Sends one or more frames, read in one go from the source."""
+        # the last frame was captured just now, the ones before it earlier
+        captured = time.time() - (len(frames) / self.frame_bytes) * self.frame_duration
+        for start in range(0, len(frames), self.frame_bytes):
+            captured += self.frame_duration
+            payload, state = self.codec.encode(frames[start : start + self.frame_bytes])
+            header = HEADER.pack(self.codec.ID, self.sequence, captured, *state)
+            self._socket.sendto(header + payload, self.address)
+            self.sequence = (self.sequence + 1) % 2**32
+
+    def close(self) -> None:
+        self._socket.close()
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(address={self.address}, "
+            f"codec={self.codec.__class__.__name__}, sequence={self.sequence}"
+        )
+
+
+class NetworkSource:
+    """Receives frames of a remote microphone with the contract of Microphone.
+
+    Packets go into a jitter buffer keyed by sequence number. After it holds
+    jitter_buffer milliseconds, read() plays the frames out in order on the
+    local clock, one per frame duration. A frame that has not arrived when
+    it is due is concealed by repeating the last frame at half the level,
+    falling to silence after a few frames; if it arrives later it is dropped.
+    The buffer is trimmed back when it grows past twice its depth, so latency
+    stays bounded when the network delivers a burst.
+    """
+
+    live = True
+    # seconds without audio before read reports an underrun
+    READ_TIMEOUT = 1
+    MAX_CONCEALED = 5
+    # a sequence number this far behind means the sender restarted
+    RESTART_GAP = 1000
+
+    def __init__(self, config: Config) -> None:
+        self.sampling_rate = config.source.sampling_rate
+        self.channels = config.source.channels
+        self.frames_per_buffer = frame_size(config, self.sampling_rate)
+        self.frame_duration = self.frames_per_buffer / self.sampling_rate
+        self.frame_bytes = self.frames_per_buffer * self.channels * 2
+        self.host = config.source.host
+        self.port = config.source.port
+        self.depth = max(
+            round(config.source.jitter_buffer / 1000 / self.frame_duration), 1
+        )
+        self._codecs = {codec.ID: codec for codec in CODECS.values()}
+        self._decoders: Dict[int, Codec] = {}
+        self._frames: Dict[int, bytes] = {}
+        self._next: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._transit: Optional[float] = None
+        self.jitter = 0.0
+        self.received = 0
+        self.concealed = 0
+        self.late = 0
+        self.trimmed = 0
+        self.underruns = 0
+
+    def _decoder(self, codec: int) -> Codec:
+        decoder = self._decoders.get(codec)
+        if decoder is None:
+            decoder = self._decoders[codec] = self._codecs[codec](self.channels)
+        return decoder
+
+    def _receive(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                packet = self._socket.recv(MAX_PACKET)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            arrived = time.time()
+            try:
+                codec, sequence, captured, *state = HEADER.unpack_from(packet)
+                frames = self._decoder(codec).decode(
+                    packet[HEADER.size :], tuple(state)
+                )
+            except (struct.error, KeyError, ValueError) as error:
+                logger.debug("malformed packet dropped: %s", error)
+                continue
+            if len(frames) != self.frame_bytes:
+                logger.debug("packet of %d bytes dropped", len(frames))
+                continue
+            # interarrival jitter as in rfc 3550, the clock offset cancels out
+            transit = arrived - captured
+            if self._transit is not None:
+                self.jitter += (abs(transit - self._transit) - self.jitter) / 16
+            self._transit = transit
+            with self._lock:
+                self.received += 1
+                if self._next is not None and sequence < self._next:
+                    if self._next - sequence < self.RESTART_GAP:
+                        self.late += 1
+                        continue
+                    logger.info("sender restarted")
+                    self._frames.clear()
+                    self._next = None
+                self._frames[sequence] = frames
+
+    def _take(self) -> Optional[bytes]:
+        """Returns the frame that is due, None when it has not arrived."""
+        with self._lock:
+            if self._next is None:
+                # the sender restarted, go on with its oldest frame
+                if not self._frames:
+                    return None
+                self._next = min(self._frames)
+            if len(self._frames) > 2 * self.depth:
+                # a burst came in, drop the oldest frames down to the depth
+                newest = max(self._frames)
+                for sequence in [s for s in self._frames if s <= newest - self.depth]:
+                    del self._frames[sequence]
+                self.trimmed += newest - self.depth + 1 - self._next
+                self._next = newest - self.depth + 1
+            frames = self._frames.pop(self._next, None)
+            self._next += 1
+            return frames
+
+    def _prefill(self) -> bool:
+        """Waits until the jitter buffer holds depth frames."""
+        waited = 0.0
+        while not self._stopped.is_set():
+            with self._lock:
+                if len(self._frames) >= self.depth:
+                    self._next = min(self._frames)
+                    return True
+                self._next = None
+            time.sleep(self.frame_duration)
+            waited += self.frame_duration
+            if waited >= self.READ_TIMEOUT:
+                self.underruns += 1
+                waited = 0.0
+                logger.warning("no audio received from %s:%d", self.host, self.port)
+        return False
+
+    def read(
+        self,
+    ) -> Generator[bytes, None, None]:
+        logger.info("begin reading stream")
+        silence = bytes(self.frame_bytes)
+        while self._prefill():
+            last = silence
+            missing = 0
+            due = time.perf_counter()
+            while not self._stopped.is_set() and missing <= self.MAX_CONCEALED:
+                due += self.frame_duration
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                frames = self._take()
+                if frames is None:
+                    missing += 1
+                    self.concealed += 1
+                    samples = np.frombuffer(last, dtype=np.int16) >> 1
+                    last = frames = samples.astype(np.int16).tobytes()
+                else:
+                    missing = 0
+                    last = frames
+                yield frames
+            if missing:
+                logger.warning("stream from %s:%d interrupted", self.host, self.port)
+        logger.info("finished reading stream")
+
+    def stop(self) -> None:
+        """Ends a running read."""
+        self._stopped.set()
+
+    def __call__(
+        self, input_device_index=None, frames_per_buffer=None
+    ) -> "NetworkSource":
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((self.host, self.port))
+        self._socket.settimeout(0.5)
+        return self
+
+    def __enter__(self):
+        logger.info("enter source on %s:%d", self.host, self.port)
+        self._stopped.clear()
+        self._receiver = threading.Thread(
+            target=self._receive, name="network-source", daemon=True
+        )
+        self._receiver.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ):
+        logger.info("exit source")
+        self._stopped.set()
+        self._receiver.join()
+        self._socket.close()
+        logger.info("%s", self)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(host={self.host}, port={self.port}, "
+            f"depth={self.depth}, received={self.received}, "
+            f"concealed={self.concealed}, late={self.late}, "
+            f"trimmed={self.trimmed}, underruns={self.underruns}, "
+            f"jitter={self.jitter * 1000:.1f} ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Sends the local microphone to the network source of a "
+        "remote asr service"
+    )
+    parser.add_argument("host", help="address of the asr service")
+    parser.add_argument("--config", default="asr.yaml", help="asr config file")
+    parser.add_argument("--port", type=int, help="overrides the port of the config")
+    parser.add_argument(
+        "--codec", choices=list(CODECS), help="overrides the codec of the config"
+    )
+    args = parser.parse_args()
+
+    configs = load_config(args.config)
+    config: Config = configs["asr"]
+    config.source = configs["network"]
+    if args.port is not None:
+        config.source.port = args.port
+    if args.codec is not None:
+        config.source.codec = args.codec
+    # the source module registers the network source, import it late
+    from pycommons.audio.source import Microphone
+
+    microphone = Microphone(config)
+    sender = NetworkSender(config, args.host)
+    logger.info("sending to %s", sender)
+    signal.signal(signal.SIGTERM, lambda *_: microphone.stop())
+    try:
+        with microphone() as stream:
+            for frames in stream.read():
+                sender(frames)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sender.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import logging
+from math import gcd
+from typing import List
+
+import numpy as np
+from pycommons.config.config import Config
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def frame_size(config: Config, rate: int) -> int:
+    """Returns the samples per frame at rate for frames of the source duration."""
+    sampling_rate = config.source.sampling_rate
+    # frames_per_buffer may be left to portaudio, then assume 10 ms frames
+    frames_per_buffer = config.source.frames_per_buffer or sampling_rate // 100
+    return round(frames_per_buffer * rate / sampling_rate)
+
+
+class ChannelMixer:
+    """Turns interleaved int16 frames of several channels into one channel.
+
+    In select mode a single channel is picked, in downmix mode all channels
+    are averaged. The beamform mode is handled by the beamformer module.
+    """
+
+    MODES = ("select", "downmix")
+
+    def __init__(self, channels: int, mode: str, channel: int = 0) -> None:
+        if mode not in self.MODES:
+            raise ValueError(f"unknown channel mode {mode}")
+        if not 0 <= channel < channels:
+            raise ValueError(f"channel {channel} out of range for {channels} channels")
+        self.channels = channels
+        self.mode = mode
+        self.channel = channel
+
+    def __call__(self, frames: bytes) -> np.ndarray:
+        samples = np.frombuffer(frames, dtype=np.int16).reshape(-1, self.channels)
+        if self.mode == "select":
+            return samples[:, self.channel].astype(np.float32)
+        return samples.mean(axis=1, dtype=np.float32)
+
+
+class PolyphaseResampler:
+    """Streaming rational resampler with a polyphase windowed-sinc filter.
+
+    The rate is changed by up / down after reducing both rates by their
+    greatest common divisor. Only the filter taps hit by an output sample are
+    evaluated, so the cost does not grow with the upsampling factor. The
+    last input samples are kept between calls, frames can be passed in one
+    after another without clicks at their borders.
+    """
+
+    TAPS_PER_PHASE = 32
+    KAISER_BETA = 6.0
+
+    def __init__(self, input_rate: int, output_rate: int) -> None:
+        divisor = gcd(input_rate, output_rate)
+        self.up = output_rate // divisor
+        self.down = input_rate // divisor
+        taps = self.TAPS_PER_PHASE * self.up
+        # cut off just below the lower nyquist frequency, in upsampled units
+        cutoff = 0.9 / max(self.up, self.down)
+        t = np.arange(taps) - (taps - 1) / 2
+        h = cutoff * np.sinc(cutoff * t) * np.kaiser(taps, self.KAISER_BETA)
+        h *= self.up / h.sum()
+        # bank[phase, k] weights the input sample k steps before the output
+        self.bank = h.reshape(self.TAPS_PER_PHASE, self.up).T.astype(np.float32)
+        self._history = np.zeros(self.TAPS_PER_PHASE - 1, dtype=np.float32)
+        self._consumed = 0
+        self._produced = 0
+
+    def __call__(self, samples: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return samples
+        buffer = np.concatenate((self._history, samples))
+        offset = self._consumed - len(self._history)
+        self._consumed += len(samples)
+
+        # every output sample whose newest input sample is available
+        end = (self._consumed * self.up + self.down - 1) // self.down
+        positions = np.arange(self._produced, end, dtype=np.int64) * self.down
+        self._produced = end
+        newest = positions // self.up - offset
+        phases = positions % self.up
+        indices = newest[:, None] - np.arange(self.TAPS_PER_PHASE)[None, :]
+        output = np.einsum("ij,ij->i", buffer[indices], self.bank[phases])
+
+        self._history = buffer[-(self.TAPS_PER_PHASE - 1) :]
+        return output
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(up={self.up}, down={self.down}"
+
+
+class Reframer:
+    """Collects samples and cuts them into int16 frames of frame_size samples."""
+
+    def __init__(self, frame_size: int) -> None:
+        self.frame_size = frame_size
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def __call__(self, samples: np.ndarray) -> List[bytes]:
+        pending = np.concatenate((self._pending, samples))
+        count = len(pending) // self.frame_size
+        frames = np.clip(
+            np.rint(pending[: count * self.frame_size]), -32768, 32767
+        ).astype(np.int16)
+        self._pending = pending[count * self.frame_size :]
+        return [frame.tobytes() for frame in frames.reshape(count, self.frame_size)]
@@ -0,0 +1,99 @@
+import logging
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+DROP_POLICIES = ("oldest", "newest")
+
+
+class RingBuffer:
+    """Fixed capacity frame buffer for one producer and one consumer.
+
+    The storage is allocated once. The producer only moves the write count
+    and the consumer only moves the read count, so neither side takes a
+    lock. Both counts grow forever; the slot of a frame is its count modulo
+    the capacity.
+
+    The first max_frames slots are mirrored behind the end of the storage,
+    so the consumer always gets up to max_frames frames as one contiguous
+    memoryview, even when they wrap around. A view stays valid until it is
+    released.
+
+    When the buffer is full, the drop policy decides what is lost. With
+    newest, the producer drops the incoming frame. With oldest, the producer
+    overwrites the oldest frame and the consumer skips ahead past what was
+    overwritten. In that case a producer that laps the consumer may also
+    overwrite a view that has not been released yet. Dropped frames are
+    counted as overflows.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        frame_bytes: int,
+        max_frames: int = 1,
+        drop_policy: str = "oldest",
+    ) -> None:
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"unknown drop policy {drop_policy}")
+        if not 0 < max_frames <= capacity:
+            raise ValueError("max_frames has to be between 1 and the capacity")
+        self.capacity = capacity
+        self.frame_bytes = frame_bytes
+        self.max_frames = max_frames
+        self.drop_oldest = drop_policy == "oldest"
+        self._size = capacity * frame_bytes
+        self._mirror = max_frames * frame_bytes
+        self._data = bytearray(self._size + self._mirror)
+        self._view = memoryview(self._data)
+        self._write = 0
+        self._read = 0
+        self.overflows = 0
+        self.underruns = 0
+
+    def __len__(self) -> int:
+        return min(self._write - self._read, self.capacity)
+
+    def write(self, frames: bytes) -> None:
+        """Copies one frame in, called by the producer only."""
+        write = self._write
+        if not self.drop_oldest and write - self._read >= self.capacity:
+            self.overflows += 1
+            return
+        offset = (write % self.capacity) * self.frame_bytes
+        end = offset + self.frame_bytes
+        self._view[offset:end] = frames
+        if offset < self._mirror:
+            self._view[self._size + offset : self._size + end] = frames
+        # publish the frame only after it was copied
+        self._write = write + 1
+
+    def peek(self) -> memoryview:
+        """Returns up to max_frames unreleased frames, called by the consumer.
+
+        The view is empty when no frame is available.
+        """
+        write = self._write
+        if write - self._read > self.capacity:
+            # the producer overwrote frames the consumer did not read yet
+            self.overflows += write - self._read - self.capacity
+            self._read = write - self.capacity
+        count = min(write - self._read, self.max_frames)
+        offset = (self._read % self.capacity) * self.frame_bytes
+        return self._view[offset : offset + count * self.frame_bytes]
+
+    def release(self, view: memoryview) -> None:
+        """Hands the frames of a peeked view back to the producer."""
+        self._read += len(view) // self.frame_bytes
+
+    def reset(self) -> None:
+        self._write = 0
+        self._read = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(capacity={self.capacity}, "
+            f"frame_bytes={self.frame_bytes}, max_frames={self.max_frames}, "
+            f"drop_oldest={self.drop_oldest}, frames={len(self)}, "
+            f"overflows={self.overflows}, underruns={self.underruns}"
+        )
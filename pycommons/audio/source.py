@@ -1,10 +1,18 @@
 import logging
+import mmap
+import os
+import struct
+import threading
+import time
 from enum import Enum
-from queue import Queue
 from types import TracebackType
-from typing import Dict, Generator, List, Optional, Type, Union
+from typing import Dict, Generator, List, Optional, Tuple, Type, Union
 
 import pyaudio
+from pycommons.audio.devices import registry
+from pycommons.audio.network import NetworkSource
+from pycommons.audio.processing import frame_size
+from pycommons.audio.ringbuffer import RingBuffer
 from pycommons.config.config import Config
 
 logger: logging.Logger = logging.getLogger(__name__)
@@ -18,45 +26,80 @@ CONFIG_SAMPLE_FORMATS = {"int16": SampleFormat.INT16}
 
 
 def get_input_devices() -> List[Dict]:
-    source = pyaudio.PyAudio()
-    device_count = source.get_device_count()
-    device_apis = []
-    for index in range(device_count):
-        info = source.get_device_info_by_index(index)
-        if info["maxInputChannels"] > 0:
-            device_apis.append(info)
-    source.terminate()
-    return device_apis
+    return registry.input_devices()
 
 
 def get_input_device_by_name(name: str) -> Union[Dict, None]:
-    source = pyaudio.PyAudio()
-    device_count = source.get_device_count()
-    device = None
-    for index in range(device_count):
-        info = source.get_device_info_by_index(index)
-        if info["name"] is name:
-            device = info
-            break
-    source.terminate()
-    return device
+    return registry.find(name)
 
 
 class Microphone:
+    """Captures from a PortAudio input device into a ring buffer.
+
+    The stream callback runs on a PortAudio thread and only copies the frame
+    into the preallocated ring buffer, the reader polls it for new frames.
+    """
+
+    live = True
+
+    # seconds without audio before read reports an underrun
+    READ_TIMEOUT = 1
+
     def __init__(self, config: Config) -> None:
         self.sampling_rate = config.source.sampling_rate
         self.sample_format = CONFIG_SAMPLE_FORMATS[config.source.sample_format]
-        self.input_device_index = config.source.input_device_index
-        self.frames_per_buffer = config.source.frames_per_buffer
+        self.channels = config.source.channels
+        # a device name or pattern takes precedence over the index
+        self.input_device_index = (
+            config.source.input_device_index
+            if config.source.input_device is None
+            else config.source.input_device
+        )
+        # the ring buffer needs frames of a fixed size
+        self.frames_per_buffer = frame_size(config, self.sampling_rate)
+        self.buffer_duration = config.source.buffer_duration
+        self.drop_policy = config.source.drop_policy
+        self.read_frames = config.source.read_frames
+        # set when read ended because the audio devices changed
+        self.reopen = False
 
     def read(
         self,
-    ) -> Generator[bytes, None, None]:
+    ) -> Generator[memoryview, None, None]:
+        """Yields views of up to read_frames frames as they arrive.
+
+        A view is only valid until the next one is requested, the frames
+        have to be copied to keep them. When a sound device is plugged in or
+        removed, read ends with reopen set, so the stream can be opened again
+        on the refreshed devices.
+        """
         logger.info("begin reading stream")
+        buffer = self._buffer
+        poll = self.frames_per_buffer / self.sampling_rate / 2
+        waited = 0.0
         while not self._stream.is_stopped() and self._stream.is_active():
-            yield self._queue.get()
+            if registry.stale:
+                logger.info("audio devices changed, stream has to be reopened")
+                self.reopen = True
+                break
+            frames = buffer.peek()
+            if not frames:
+                time.sleep(poll)
+                waited += poll
+                if waited >= self.READ_TIMEOUT:
+                    buffer.underruns += 1
+                    waited = 0.0
+                    logger.warning("no audio received from stream")
+                continue
+            waited = 0.0
+            yield frames
+            buffer.release(frames)
         logger.info("finished reading stream")
 
+    def stop(self) -> None:
+        """Stops the stream, which ends a running read."""
+        self._stream.stop_stream()
+
     def _callback(
         self,
         in_data: bytes,
@@ -64,7 +107,7 @@ class Microphone:
         time_info: dict,
         status_flags: int,
     ):
-        self._queue.put(in_data)
+        self._buffer.write(in_data)
         return (
             None,
             pyaudio.paContinue,
@@ -72,21 +115,27 @@ class Microphone:
 
     def __call__(self, input_device_index=None, frames_per_buffer=None) -> "Microphone":
         logger.debug(
-            f"params: input_device_index={input_device_index}, frames_per_buffer={frames_per_buffer}"
+            "params: input_device_index=%s, frames_per_buffer=%s",
+            input_device_index,
+            frames_per_buffer,
         )
+        if frames_per_buffer is not None:
+            self.frames_per_buffer = frames_per_buffer
+        self.reopen = False
 
-        self._source = pyaudio.PyAudio()
+        device_index = registry.resolve(
+            self.input_device_index
+            if input_device_index is None
+            else input_device_index
+        )
+        self._source = registry.acquire()
         self._stream = self._source.open(
             rate=self.sampling_rate,
-            channels=1,
+            channels=self.channels,
             format=self.sample_format.value,
             input=True,  # Set Stream as Input Stream
-            input_device_index=self.input_device_index
-            if input_device_index is None
-            else input_device_index,
-            frames_per_buffer=self.frames_per_buffer
-            if frames_per_buffer is None
-            else frames_per_buffer,
+            input_device_index=device_index,
+            frames_per_buffer=self.frames_per_buffer,
             start=False,  # Dont start recording immediately
             stream_callback=self._callback,
         )
@@ -94,7 +143,18 @@ class Microphone:
 
     def __enter__(self):
         logger.info("enter source")
-        self._queue = Queue()
+        frame_bytes = (
+            self.frames_per_buffer
+            * self.channels
+            * pyaudio.get_sample_size(self.sample_format.value)
+        )
+        capacity = max(
+            self.buffer_duration * self.sampling_rate // 1000 // self.frames_per_buffer,
+            self.read_frames,
+        )
+        self._buffer = RingBuffer(
+            capacity, frame_bytes, self.read_frames, self.drop_policy
+        )
 
         self._stream.start_stream()
         return self
@@ -106,16 +166,167 @@ class Microphone:
         traceback: Optional[TracebackType],
     ):
         logger.info("exit source")
-        self._stream.stop_stream()
+        if not self._stream.is_stopped():
+            self._stream.stop_stream()
         self._stream.close()
-        self._source.terminate()
-        self._queue = None
+        registry.release()
+        if self._buffer.overflows or self._buffer.underruns:
+            logger.warning("ring buffer %s", self._buffer)
 
     def __repr__(self) -> str:
         return (
             f"{self.__class__.__name__}(_sampling_rate={self.sampling_rate}, "
             f"_sample_format={self.sample_format}, "
+            f"_channels={self.channels}, "
             f"_input_device_index={self.input_device_index}, "
             "_frames_per_buffer="
-            f"{self.frames_per_buffer}"
+            f"{self.frames_per_buffer}, "
+            f"_buffer_duration={self.buffer_duration}, "
+            f"_drop_policy={self.drop_policy}, "
+            f"_read_frames={self.read_frames}"
         )
+
+
+class FileSource:
+    """Replays wav or raw pcm files with the contract of Microphone.
+
+    Files are memory mapped and read() yields views straight into the
+    mapping, nothing is copied before the consumer mixes the frames. The
+    files are expected in the format of the source config; raw files are
+    taken as is, the header of a wav file is checked against it. With speed 1
+    frames come in real time, with N at N times real time and with 0 as fast
+    as they are read.
+
+    A file source is not live: the capture bus waits for its subscribers
+    instead of dropping frames they did not read in time.
+    """
+
+    live = False
+    EXTENSIONS = (".wav", ".raw", ".pcm")
+
+    def __init__(self, config: Config) -> None:
+        self.sampling_rate = config.source.sampling_rate
+        self.sample_format = CONFIG_SAMPLE_FORMATS[config.source.sample_format]
+        self.channels = config.source.channels
+        self.frames_per_buffer = frame_size(config, self.sampling_rate)
+        self.read_frames = config.source.read_frames
+        self.path = config.source.path
+        self.speed = config.source.speed
+        self.sample_size = pyaudio.get_sample_size(self.sample_format.value)
+        self._stopped = threading.Event()
+
+    def files(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return [self.path]
+        return [
+            os.path.join(self.path, name)
+            for name in sorted(os.listdir(self.path))
+            if name.lower().endswith(self.EXTENSIONS)
+        ]
+
+    def _data(self, path: str, mapping: mmap.mmap) -> Tuple[int, int]:
+        """Returns offset and length of the samples in a mapped file."""
+        if not path.lower().endswith(".wav"):
+            return 0, len(mapping)
+        if mapping[:4] != b"RIFF" or mapping[8:12] != b"WAVE":
+            raise ValueError(f"{path} is not a wav file")
+        offset = 12
+        while offset + 8 <= len(mapping):
+            chunk, size = struct.unpack_from("<4sI", mapping, offset)
+            offset += 8
+            if chunk == b"fmt ":
+                _, channels, rate, _, _, bits = struct.unpack_from(
+                    "<HHIIHH", mapping, offset
+                )
+                if (channels, rate, bits // 8) != (
+                    self.channels,
+                    self.sampling_rate,
+                    self.sample_size,
+                ):
+                    raise ValueError(
+                        f"{path} has {channels} channels at {rate} Hz and "
+                        f"{bits} bits, expected {self.channels} channels at "
+                        f"{self.sampling_rate} Hz and {self.sample_size * 8} bits"
+                    )
+            elif chunk == b"data":
+                return offset, min(size, len(mapping) - offset)
+            # chunks are padded to an even size
+            offset += size + size % 2
+        raise ValueError(f"{path} has no data chunk")
+
+    def read(
+        self,
+    ) -> Generator[memoryview, None, None]:
+        """Yields views of up to read_frames frames, paced by speed.
+
+        A view is only valid until the next one is requested, a trailing
+        partial frame of a file is skipped.
+        """
+        logger.info("begin reading files")
+        frame_bytes = self.frames_per_buffer * self.channels * self.sample_size
+        frame_duration = self.frames_per_buffer / self.sampling_rate
+        started = time.perf_counter()
+        position = 0.0
+        for path in self.files():
+            with open(path, "rb") as file, mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mapping:
+                offset, length = self._data(path, mapping)
+                end = offset + length - length % frame_bytes
+                logger.info("replaying %s", path)
+                with memoryview(mapping) as memory:
+                    for start in range(offset, end, frame_bytes * self.read_frames):
+                        if self._stopped.is_set():
+                            break
+                        stop = min(start + frame_bytes * self.read_frames, end)
+                        if self.speed > 0:
+                            # frames are due once they would have been recorded
+                            position += (stop - start) / frame_bytes * frame_duration
+                            delay = started + position / self.speed
+                            delay -= time.perf_counter()
+                            if delay > 0:
+                                time.sleep(delay)
+                        with memory[start:stop] as frames:
+                            yield frames
+            if self._stopped.is_set():
+                break
+        logger.info("finished reading files")
+
+    def stop(self) -> None:
+        """Ends a running read."""
+        self._stopped.set()
+
+    def __call__(self, input_device_index=None, frames_per_buffer=None) -> "FileSource":
+        return self
+
+    def __enter__(self):
+        logger.info("enter source")
+        self._stopped.clear()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ):
+        logger.info("exit source")
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(_sampling_rate={self.sampling_rate}, "
+            f"_sample_format={self.sample_format}, "
+            f"_channels={self.channels}, _path={self.path}, _speed={self.speed}"
+        )
+
+
+# sources by the yaml tag of their config
+SOURCES: Dict[str, Type[Union[Microphone, FileSource, NetworkSource]]] = {
+    "!microphone": Microphone,
+    "!filesource": FileSource,
+    "!networksource": NetworkSource,
+}
+
+
+def create_source(config: Config) -> Union[Microphone, FileSource, NetworkSource]:
+    return SOURCES[config.source.yaml_tag](config)
@@ -1,7 +1,7 @@
 import logging
 import os
 from pprint import pformat
-from typing import Any, List, Union
+from typing import Any, Dict, List, Optional, Union
 
 import yaml
 
@@ -19,15 +19,85 @@ class MicrophoneConfig(yaml.YAMLObject):
     def __init__(self) -> None:
         self.sampling_rate: int
         self.sample_format: str
+        self.channels: int
+        self.channel_mode: str
+        self.channel: int
+        self.mic_positions: Optional[List[List[float]]]
+        self.beamform_budget: float
+        self.input_device: Optional[str]
         self.input_device_index: int
         self.frames_per_buffer: int
+        self.preroll_duration: int
+        self.history_duration: int
+        self.buffer_duration: int
+        self.drop_policy: str
+        self.read_frames: int
 
     def __repr__(self):
         return (
             f"{self.__class__.__name__}(sampling_rate={self.sampling_rate}, "
             f"sample_format={self.sample_format}, "
+            f"channels={self.channels}, channel_mode={self.channel_mode}, "
+            f"channel={self.channel}, mic_positions={self.mic_positions}, "
+            f"beamform_budget={self.beamform_budget}, "
+            f"input_device={self.input_device}, "
             f"input_device_index={self.input_device_index}, "
-            f"frames_per_buffer={self.frames_per_buffer}"
+            f"frames_per_buffer={self.frames_per_buffer}, "
+            f"preroll_duration={self.preroll_duration}, "
+            f"history_duration={self.history_duration}, "
+            f"buffer_duration={self.buffer_duration}, "
+            f"drop_policy={self.drop_policy}, read_frames={self.read_frames}"
+        )
+
+
+class FileSourceConfig(MicrophoneConfig):
+    yaml_tag = "!filesource"
+
+    def __init__(self) -> None:
+        super().__init__()
+        # wav or raw pcm file, or a folder of them replayed in name order
+        self.path: str
+        # 1 is real time, 0 as fast as the consumers read
+        self.speed: float
+
+    def __repr__(self):
+        return f"{super().__repr__()}, path={self.path}, speed={self.speed}"
+
+
+class NetworkSourceConfig(MicrophoneConfig):
+    yaml_tag = "!networksource"
+
+    def __init__(self) -> None:
+        super().__init__()
+        # address the source binds to, senders are given the asr host
+        self.host: str
+        self.port: int
+        # pcm, mulaw or adpcm, only used by the sender
+        self.codec: str
+        self.jitter_buffer: int
+
+    def __repr__(self):
+        return (
+            f"{super().__repr__()}, host={self.host}, port={self.port}, "
+            f"codec={self.codec}, jitter_buffer={self.jitter_buffer}"
+        )
+
+
+class EnergyGateConfig(yaml.YAMLObject):
+    yaml_tag = "!energygate"
+
+    def __init__(self) -> None:
+        self.enable: bool
+        self.margin_db: float
+        self.zcr_threshold: float
+        self.lookback: int
+        self.hangover: int
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(enable={self.enable}, "
+            f"margin_db={self.margin_db}, zcr_threshold={self.zcr_threshold}, "
+            f"lookback={self.lookback}, hangover={self.hangover}"
         )
 
 
@@ -35,17 +105,19 @@ class SnowboyConfig(yaml.YAMLObject):
     yaml_tag = "!snowboy"
 
     def __init__(self) -> None:
-        self.decoder_model: str
-        self.sensitivity: Union[int, List[int]]
+        self.decoder_model: Union[str, List[str]]
+        self.sensitivity: Union[float, List[float]]
         self.audio_gain: float
         self.apply_frontend: bool
+        self.energy_gate: Optional[EnergyGateConfig]
 
     def __repr__(self):
         return (
             f"{self.__class__.__name__}(decoder_model={self.decoder_model}, "
             f"sensitivity={self.sensitivity}"
             f"audio_gain={self.audio_gain}"
-            f"apply_frontend={self.apply_frontend}"
+            f"apply_frontend={self.apply_frontend}, "
+            f"energy_gate={self.energy_gate}"
         )
 
 
@@ -53,32 +125,33 @@ class SadConfig(yaml.YAMLObject):
     yaml_tag = "!sad"
 
     def __init__(self) -> None:
+        self.vad_engine: str
         self.vad_mode: int
+        self.vad_batch: int
         self.vad_sampling_rate: int
-        self.silence_threshold: int
+        self.short_silence_threshold: int
+        self.long_silence_threshold: int
+        self.end_padding: int
         self.min_speech_duration_threshold: int
         self.max_speech_duration_threshold: int
-        self.input_device_index: int
-        self.frames_per_buffer: int
 
     def __repr__(self):
         return (
-            f"{self.__class__.__name__}(vad_mode={self.vad_mode}, "
+            f"{self.__class__.__name__}(vad_engine={self.vad_engine}, "
+            f"vad_mode={self.vad_mode}, vad_batch={self.vad_batch}, "
             f"vad_sampling_rate={self.vad_sampling_rate}, "
-            f"silence_threshold={self.silence_threshold}, "
+            f"short_silence_threshold={self.short_silence_threshold}, "
+            f"long_silence_threshold={self.long_silence_threshold}, "
+            f"end_padding={self.end_padding}, "
             "min_speech_duration_threshold="
             f"{self.min_speech_duration_threshold}, "
             "max_speech_duration_threshold="
-            f"{self.max_speech_duration_threshold}, "
-            "input_device_index="
-            f"{self.input_device_index}, "
-            "frames_per_buffer="
-            f"{self.frames_per_buffer}"
+            f"{self.max_speech_duration_threshold}"
         )
 
 
-class DeepSpeechLoggerConfig(yaml.YAMLObject):
-    yaml_tag = "!deepspeechlogger"
+class SttLoggerConfig(yaml.YAMLObject):
+    yaml_tag = "!sttlogger"
 
     def __init__(self) -> None:
         self.enable: bool
@@ -92,34 +165,147 @@ class DeepSpeechLoggerConfig(yaml.YAMLObject):
         )
 
 
+class CommandsConfig(yaml.YAMLObject):
+    yaml_tag = "!commands"
+
+    def __init__(self) -> None:
+        self.enable: bool
+        self.phrases: List[str]
+        self.scorer: Optional[str]
+        self.beam_width: int
+        self.boost: float
+        self.confidence_threshold: float
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(enable={self.enable}, "
+            f"phrases={self.phrases}, scorer={self.scorer}, "
+            f"beam_width={self.beam_width}, boost={self.boost}, "
+            f"confidence_threshold={self.confidence_threshold}"
+        )
+
+
 class DeepSpeechConfig(yaml.YAMLObject):
     yaml_tag = "!deepspeech"
 
     def __init__(self) -> None:
         self.model: str
         self.scorer: str
-        self.logger: DeepSpeechLoggerConfig
+        self.sampling_rate: int
+        self.streaming: bool
+        self.partial_interval: float
+        self.workers: int
+        self.beam_width: Optional[int]
+        self.lm_alpha: Optional[float]
+        self.lm_beta: Optional[float]
+        self.commands: CommandsConfig
+        self.logger: SttLoggerConfig
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(model={self.model}, "
+            f"scorer={self.scorer}, sampling_rate={self.sampling_rate}, "
+            f"streaming={self.streaming}, "
+            f"partial_interval={self.partial_interval}, "
+            f"workers={self.workers}, beam_width={self.beam_width}, "
+            f"lm_alpha={self.lm_alpha}, lm_beta={self.lm_beta}, "
+            f"commands={self.commands}, "
+            f"logger={self.logger}"
+        )
+
+
+class VoskConfig(yaml.YAMLObject):
+    yaml_tag = "!vosk"
+
+    def __init__(self) -> None:
+        self.model: str
+        self.sampling_rate: int
+        self.streaming: bool
+        self.partial_interval: float
+        self.workers: int
+        self.logger: SttLoggerConfig
 
     def __repr__(self):
         return (
             f"{self.__class__.__name__}(model={self.model}, "
-            f"scorer={self.scorer}, logger={self.logger}"
+            f"sampling_rate={self.sampling_rate}, streaming={self.streaming}, "
+            f"partial_interval={self.partial_interval}, "
+            f"workers={self.workers}, logger={self.logger}"
+        )
+
+
+class SttClientConfig(yaml.YAMLObject):
+    yaml_tag = "!sttclient"
+
+    def __init__(self) -> None:
+        self.socket: str
+        self.timeout: float
+        self.sampling_rate: int
+        self.logger: SttLoggerConfig
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(socket={self.socket}, "
+            f"timeout={self.timeout}, sampling_rate={self.sampling_rate}, "
+            f"logger={self.logger}"
         )
 
 
+class SttServerConfig(yaml.YAMLObject):
+    yaml_tag = "!sttserver"
+
+    def __init__(self) -> None:
+        self.socket: str
+        self.stt: Union[DeepSpeechConfig, VoskConfig]
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(socket={self.socket}, stt={self.stt}"
+
+
+class MqttConfig(yaml.YAMLObject):
+    yaml_tag = "!mqtt"
+
+    def __init__(self) -> None:
+        self.enable: bool
+        self.host: str
+        self.port: int
+        self.topic: str
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(enable={self.enable}, host={self.host}, "
+            f"port={self.port}, topic={self.topic}"
+        )
+
+
+class PipelineConfig(yaml.YAMLObject):
+    yaml_tag = "!pipeline"
+
+    def __init__(self) -> None:
+        self.stt: Union[DeepSpeechConfig, VoskConfig, SttClientConfig]
+        self.topic: Optional[str]
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(stt={self.stt}, topic={self.topic}"
+
+
 class Config(yaml.YAMLObject):
     yaml_tag = "!asr"
 
     def __init__(self) -> None:
-        self.source: MicrophoneConfig
+        self.source: Union[MicrophoneConfig, FileSourceConfig, NetworkSourceConfig]
         self.kws: SnowboyConfig
         self.sad: SadConfig
-        self.stt: DeepSpeechConfig
+        self.stt: Union[DeepSpeechConfig, VoskConfig, SttClientConfig]
+        self.mqtt: MqttConfig
+        # per hotword model, models without a pipeline use stt and mqtt
+        self.pipelines: Dict[str, PipelineConfig]
 
     def __repr__(self):
         return (
             f"{self.__class__.__name__}(source={self.source}, "
-            f"kws={self.kws}, sad={self.sad}, stt={self.stt})"
+            f"kws={self.kws}, sad={self.sad}, stt={self.stt}, mqtt={self.mqtt}, "
+            f"pipelines={self.pipelines})"
         )
 
 
@@ -140,12 +326,14 @@ class Logging(yaml.YAMLObject):
 
     def __init__(self) -> None:
         self.debug: bool
+        self.instrumentation: bool
         self.handlers: Handlers
         self.format: str
 
     def __repr__(self):
         return f"{self.__class__.__name__}"
-        f"(debug={self.debug}, handlers={self.handlers}, format={self.format})"
+        f"(debug={self.debug}, instrumentation={self.instrumentation}, "
+        f"handlers={self.handlers}, format={self.format})"
 
 
 def load_config(file_name: str) -> Any:
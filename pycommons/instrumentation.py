@@ -0,0 +1,126 @@
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+from pycommons.config.config import logging_config
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class _Aggregate:
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def summary(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.minimum if self.count else None,
+            "max": self.maximum if self.count else None,
+        }
+
+
+class SessionStats:
+    """Counters and aggregated values collected during one session.
+
+    Values are folded into count, mean, min and max as they come in, so a
+    session costs the same memory no matter how many frames it sees. Frame
+    labels like speech and silence are tracked as runs of equal labels.
+    """
+
+    enabled = True
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started = time.perf_counter()
+        self.counters: Dict[str, int] = {}
+        self.values: Dict[str, _Aggregate] = {}
+        self.runs: Dict[str, _Aggregate] = {}
+        self._label: Optional[str] = None
+        self._run = 0
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        aggregate = self.values.get(name)
+        if aggregate is None:
+            aggregate = self.values[name] = _Aggregate()
+        aggregate.add(value)
+
+    def frame(self, label: str) -> None:
+        if label != self._label:
+            self._close_run()
+            self._label = label
+        self._run += 1
+
+    def _close_run(self) -> None:
+        if self._label is not None:
+            runs = self.runs.get(self._label)
+            if runs is None:
+                runs = self.runs[self._label] = _Aggregate()
+            runs.add(self._run)
+        self._run = 0
+
+    def summary(self) -> Dict:
+        self._close_run()
+        self._label = None
+        return {
+            "duration": time.perf_counter() - self.started,
+            "counters": self.counters,
+            "values": {name: value.summary() for name, value in self.values.items()},
+            "runs": {label: runs.summary() for label, runs in self.runs.items()},
+        }
+
+
+class _NullStats:
+    """Stands in for SessionStats when instrumentation is disabled."""
+
+    enabled = False
+    name = "null"
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def observe(self, name: str, value: float) -> None:
+        pass
+
+    def frame(self, label: str) -> None:
+        pass
+
+    def summary(self) -> Dict:
+        return {}
+
+
+NULL_STATS = _NullStats()
+
+
+def session(name: str):
+    """Returns stats for a new session, a no-op object when disabled.
+
+    Hot loops should check enabled before measuring anything that costs
+    more than the call itself, like reading the clock.
+    """
+    if logging_config.instrumentation:
+        return SessionStats(name)
+    return NULL_STATS
+
+
+def emit(stats) -> None:
+    """Logs the summary of a session as one json record."""
+    if stats.enabled:
+        logger.info("%s %s", stats.name, json.dumps(stats.summary()))
@@ -31,13 +31,33 @@ class MqttClient:
             host=host, port=port, clean_start=True, properties=properties
         )
         self.logger.debug(
-            f"Sending CONNECT host='{host}' port='{port}' properties='{properties}' rc='{mqtt.error_string(rc)}'"
+            "Sending CONNECT host='%s' port='%s' properties='%s' rc='%s'",
+            host,
+            port,
+            properties,
+            mqtt.error_string(rc),
+        )
+
+    def connect_async(
+        self, host: str, port: int = 1883, properties: Properties = None
+    ) -> None:
+        self._client.connect_async(
+            host=host, port=port, clean_start=True, properties=properties
+        )
+        self.logger.debug(
+            "Connecting asynchronously host='%s' port='%s' properties='%s'",
+            host,
+            port,
+            properties,
         )
 
     def disconnect(self, reasoncode: ReasonCodes = None, properties: Properties = None):
         rc: int = self._client.disconnect(reasoncode=reasoncode, properties=properties)
         self.logger.debug(
-            f"Sending DISCONNECT reasoncode='{reasoncode}' properties='{properties}' rc='{ReasonCodes(PacketTypes.DISCONNECT, identifier=rc)}'"
+            "Sending DISCONNECT reasoncode='%s' properties='%s' rc='%s'",
+            reasoncode,
+            properties,
+            ReasonCodes(PacketTypes.DISCONNECT, identifier=rc),
         )
 
     def subscribe(
@@ -51,13 +71,23 @@ class MqttClient:
             topic=topic, qos=qos, options=options, properties=properties
         )
         self.logger.debug(
-            f"Sending SUBSCRIBE topic='{topic}' with qos='{qos}' options='{options}' properties='{properties}' mid='{mid}' rc='{mqtt.error_string(rc)}'"
+            "Sending SUBSCRIBE topic='%s' with qos='%s' options='%s' properties='%s' mid='%s' rc='%s'",
+            topic,
+            qos,
+            options,
+            properties,
+            mid,
+            mqtt.error_string(rc),
         )
 
     def unsubscribe(self, topic: str, properties: Properties = None) -> None:
         rc, mid = self._client.unsubscribe(topic, properties=properties)
         self.logger.debug(
-            f"Sending UNSUBSCRIBE topic='{topic}' properties='{properties}' mid='{mid}' rc='{mqtt.error_string(rc)}'"
+            "Sending UNSUBSCRIBE topic='%s' properties='%s' mid='%s' rc='%s'",
+            topic,
+            properties,
+            mid,
+            mqtt.error_string(rc),
         )
 
     def publish(
@@ -76,7 +106,14 @@ class MqttClient:
             properties=properties,
         )
         self.logger.debug(
-            f"Sending PUBLICH topic='{topic}' payload='{payload}' with qos='{qos}' retain='{retain}' properties='{properties}' mid='{info.mid}' rc='{mqtt.error_string(info.rc)}'"
+            "Sending PUBLICH topic='%s' payload='%s' with qos='%s' retain='%s' properties='%s' mid='%s' rc='%s'",
+            topic,
+            payload,
+            qos,
+            retain,
+            properties,
+            info.mid,
+            mqtt.error_string(info.rc),
         )
 
     def loop_start(self) -> None:
@@ -92,7 +129,16 @@ class MqttClient:
         self, client: mqtt.Client, userdata: Any, message: MQTTMessage
     ) -> None:
         self.logger.info(
-            f"Received ON_MESSAGE client_id='{client._client_id.decode('utf-8')}' userdata='{userdata}' topic='{message.topic}' payload='{message.payload}' qos='{message.qos}' retain='{message.retain}' mid='{message.info.mid}' rc='{mqtt.error_string(message.info.rc)}'"
+            "Received ON_MESSAGE client_id='%s' userdata='%s' topic='%s' payload='%s' "
+            "qos='%s' retain='%s' mid='%s' rc='%s'",
+            client._client_id.decode("utf-8"),
+            userdata,
+            message.topic,
+            message.payload,
+            message.qos,
+            message.retain,
+            message.info.mid,
+            mqtt.error_string(message.info.rc),
         )
 
     def _on_connect(
@@ -104,7 +150,13 @@ class MqttClient:
         properties: mqtt.Properties,
     ) -> None:
         self.logger.info(
-            f"Received ON_CONNECT client_id='{client._client_id.decode('utf-8')}' rc='{mqtt.connack_string(rc)}' userdata='{userdata}' flags='{flags}' properties='{properties}'"
+            "Received ON_CONNECT client_id='%s' rc='%s' userdata='%s' flags='%s' "
+            "properties='%s'",
+            client._client_id.decode("utf-8"),
+            mqtt.connack_string(rc),
+            userdata,
+            flags,
+            properties,
         )
 
     def _on_disconnect(
@@ -114,7 +166,10 @@ class MqttClient:
         rc: int,
     ) -> None:
         self.logger.info(
-            f"Received ON_DISCONNECT client_id='{client._client_id.decode('utf-8')}' rc='{ReasonCodes(PacketTypes.DISCONNECT, identifier=rc)}' userdata='{userdata}'"
+            "Received ON_DISCONNECT client_id='%s' rc='%s' userdata='%s'",
+            client._client_id.decode("utf-8"),
+            ReasonCodes(PacketTypes.DISCONNECT, identifier=rc),
+            userdata,
         )
 
     def _on_subscribe(
@@ -126,7 +181,13 @@ class MqttClient:
         properties: List[Properties],
     ) -> None:
         self.logger.info(
-            f"Received ON_SUBSCRIBE client_id='{client._client_id.decode('utf-8')}' mid='{mid}' qos='{[qos.getName() for qos in rc]}' userdata='{userdata}' properties='{properties}'"
+            "Received ON_SUBSCRIBE client_id='%s' mid='%s' qos='%s' userdata='%s' "
+            "properties='%s'",
+            client._client_id.decode("utf-8"),
+            mid,
+            [qos.getName() for qos in rc],
+            userdata,
+            properties,
         )
 
     def _on_unsubscribe(
@@ -138,10 +199,19 @@ class MqttClient:
         rc: List[ReasonCodes],
     ) -> None:
         self.logger.info(
-            f"Received ON_UNSUBSCRIBE client_id='{client._client_id.decode('utf-8')}' mid='{mid}' rc='{[qos.getName() for qos in rc]}' userdata='{userdata}' properties='{properties}'"
+            "Received ON_UNSUBSCRIBE client_id='%s' mid='%s' rc='%s' userdata='%s' "
+            "properties='%s'",
+            client._client_id.decode("utf-8"),
+            mid,
+            [qos.getName() for qos in rc],
+            userdata,
+            properties,
         )
 
     def _on_publish(self, client: mqtt.Client, userdata: Any, mid: int) -> None:
         self.logger.info(
-            f"Received ON_PUBLICH client_id='{client._client_id.decode('utf-8')}' mid='{mid}' userdata='{userdata}'"
+            "Received ON_PUBLISH client_id='%s' mid='%s' userdata='%s'",
+            client._client_id.decode("utf-8"),
+            mid,
+            userdata,
         )
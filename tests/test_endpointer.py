@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+from typing import Optional, cast
+
+import pytest
+from pycommons.config.config import Config
+
+from asr.asr.sad import Endpointer, InsufficientSpeech, SpeechThresholdExceeded
+
+SPEECH_ENERGY = 1e6
+NOISE_ENERGY = 1.0
+
+
+def make_endpointer() -> Endpointer:
+    config = SimpleNamespace(
+        sad=SimpleNamespace(
+            short_silence_threshold=5,
+            long_silence_threshold=20,
+            min_speech_duration_threshold=10,
+            max_speech_duration_threshold=40,
+        )
+    )
+    return Endpointer(cast(Config, config))
+
+
+def silence_until_end(
+    endpointer: Endpointer, speech: int, speech_energy: float = SPEECH_ENERGY
+) -> Optional[int]:
+    """Feeds speech frames, returns the silence frames until the end point."""
+    for index in range(speech):
+        assert not endpointer(index, True, speech_energy)
+    for silence in range(1, 100):
+        if endpointer(speech + silence - 1, False, NOISE_ENERGY):
+            return silence
+    return None
+
+
+def test_short_utterance_ends_after_short_silence():
+    endpointer = make_endpointer()
+    assert silence_until_end(endpointer, 11) == 6
+    assert endpointer.last_speech == 10
+
+
+def test_long_utterance_waits_for_longer_silence():
+    # two thirds of the way from the short to the long threshold
+    assert silence_until_end(make_endpointer(), 30) == 16
+
+
+def test_low_snr_extends_the_silence():
+    # half again as long as at a high snr
+    assert silence_until_end(make_endpointer(), 11, speech_energy=2.0) == 9
+
+
+def test_too_little_speech():
+    with pytest.raises(InsufficientSpeech):
+        silence_until_end(make_endpointer(), 5)
+
+
+def test_too_much_speech():
+    with pytest.raises(SpeechThresholdExceeded):
+        silence_until_end(make_endpointer(), 41)
+
+
+def test_reset_forgets_the_utterance():
+    endpointer = make_endpointer()
+    silence_until_end(endpointer, 11)
+    endpointer.reset()
+    assert endpointer.last_speech is None
+    assert endpointer.snr() is None
@@ -0,0 +1,163 @@
+import socket
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from pycommons.audio.network import CODECS, Adpcm, MuLaw, NetworkSender, NetworkSource
+
+FRAMES_PER_BUFFER = 160
+SAMPLING_RATE = 16000
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def make_config(codec: str, depth: int) -> SimpleNamespace:
+    """Returns a network source config whose jitter buffer holds depth frames."""
+    frame_duration = FRAMES_PER_BUFFER / SAMPLING_RATE * 1000
+    return SimpleNamespace(
+        source=SimpleNamespace(
+            sampling_rate=SAMPLING_RATE,
+            frames_per_buffer=FRAMES_PER_BUFFER,
+            channels=1,
+            host="127.0.0.1",
+            port=free_port(),
+            codec=codec,
+            jitter_buffer=depth * frame_duration,
+        )
+    )
+
+
+def tone(count: int) -> list:
+    """Returns count int16 frames of a 440 Hz tone, every frame different."""
+    t = np.arange(count * FRAMES_PER_BUFFER) / SAMPLING_RATE
+    samples = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+    return [frame.tobytes() for frame in np.split(samples, count)]
+
+
+def roundtrip(codec: str, frames: list) -> list:
+    """Returns what a decoder gets back for frames sent in order."""
+    encoder = CODECS[codec](1)
+    decoder = CODECS[codec](1)
+    return [decoder.decode(*encoder.encode(frame)) for frame in frames]
+
+
+def send(sender: NetworkSender, frames: list, sequences: list) -> None:
+    for sequence in sequences:
+        sender.sequence = sequence
+        sender(frames[sequence])
+
+
+def wait_received(source: NetworkSource, count: int) -> None:
+    deadline = time.time() + 2
+    while source.received < count and time.time() < deadline:
+        time.sleep(0.005)
+    assert source.received == count
+
+
+def read(source: NetworkSource, count: int) -> list:
+    stream = source.read()
+    return [next(stream) for _ in range(count)]
+
+
+@pytest.mark.parametrize("codec", list(CODECS))
+def test_loopback(codec):
+    if codec == "adpcm":
+        pytest.importorskip("audioop")
+    frames = tone(10)
+    config = make_config(codec, depth=len(frames))
+    sender = NetworkSender(config, "127.0.0.1")
+    try:
+        with NetworkSource(config)() as source:
+            sender(b"".join(frames))
+            wait_received(source, len(frames))
+            received = read(source, len(frames))
+    finally:
+        sender.close()
+    assert received == roundtrip(codec, frames)
+    assert source.concealed == 0
+    assert source.late == 0
+
+
+def test_reordered_packets_play_in_order():
+    frames = tone(6)
+    config = make_config("pcm", depth=len(frames))
+    sender = NetworkSender(config, "127.0.0.1")
+    try:
+        with NetworkSource(config)() as source:
+            send(sender, frames, [1, 0, 3, 2, 5, 4])
+            wait_received(source, len(frames))
+            received = read(source, len(frames))
+    finally:
+        sender.close()
+    assert received == frames
+    assert source.late == 0
+
+
+def test_lost_packet_is_concealed():
+    frames = tone(8)
+    config = make_config("pcm", depth=5)
+    sender = NetworkSender(config, "127.0.0.1")
+    try:
+        with NetworkSource(config)() as source:
+            send(sender, frames, [0, 1, 2, 4, 5, 6, 7])
+            wait_received(source, 7)
+            received = read(source, len(frames))
+    finally:
+        sender.close()
+    # the last frame is repeated at half the level
+    concealment = np.frombuffer(frames[2], dtype=np.int16) >> 1
+    assert received[3] == concealment.astype(np.int16).tobytes()
+    assert received[:3] == frames[:3]
+    assert received[4:] == frames[4:]
+    assert source.concealed == 1
+
+
+def test_late_packet_is_dropped():
+    frames = tone(6)
+    config = make_config("pcm", depth=5)
+    sender = NetworkSender(config, "127.0.0.1")
+    try:
+        with NetworkSource(config)() as source:
+            send(sender, frames, [0, 1, 3, 4, 5])
+            wait_received(source, 5)
+            stream = source.read()
+            received = [next(stream) for _ in range(3)]
+            # frame 2 was concealed already when it arrives
+            send(sender, frames, [2])
+            wait_received(source, 6)
+            received += [next(stream) for _ in range(3)]
+    finally:
+        sender.close()
+    assert received[3:] == frames[3:]
+    assert source.concealed == 1
+    assert source.late == 1
+
+
+def test_mulaw_matches_audioop():
+    audioop = pytest.importorskip("audioop")
+    samples = np.arange(-32768, 32768, 7, dtype=np.int16).tobytes()
+    payload, _ = MuLaw(1).encode(samples)
+    assert payload == audioop.lin2ulaw(samples, 2)
+    assert MuLaw(1).decode(payload, (0, 0)) == audioop.ulaw2lin(payload, 2)
+
+
+def test_adpcm_packet_decodes_on_its_own():
+    audioop = pytest.importorskip("audioop")
+    frames = tone(4)
+    encoder = Adpcm(1)
+    packets = [encoder.encode(frame) for frame in frames]
+    stream = audioop.adpcm2lin(b"".join(payload for payload, _ in packets), 2, None)
+    frame_bytes = len(frames[0])
+    # a decoder that missed the first packets starts on the state of the third
+    decoded = Adpcm(1).decode(*packets[2])
+    assert decoded == stream[0][2 * frame_bytes : 3 * frame_bytes]
+
+
+def test_adpcm_rejects_several_channels():
+    with pytest.raises(ValueError):
+        Adpcm(2)
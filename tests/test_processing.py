@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from pycommons.audio.processing import PolyphaseResampler
+
+
+def sine(frequency: float, rate: int, duration: float) -> np.ndarray:
+    t = np.arange(round(rate * duration)) / rate
+    return (10000 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def amplitude(samples: np.ndarray) -> float:
+    # skips the delay of the filter
+    return float(np.sqrt(2 * np.mean(samples[len(samples) // 4 :] ** 2)))
+
+
+@pytest.mark.parametrize("input_rate,output_rate", [(16000, 8000), (44100, 16000)])
+def test_output_length_follows_the_rate(input_rate, output_rate):
+    resampler = PolyphaseResampler(input_rate, output_rate)
+    frame = input_rate // 100
+    produced = sum(len(resampler(np.zeros(frame, np.float32))) for _ in range(100))
+    assert abs(produced - output_rate) <= 1
+
+
+def test_frames_match_one_block():
+    samples = sine(440, 48000, 0.5)
+    whole = PolyphaseResampler(48000, 16000)(samples)
+    resampler = PolyphaseResampler(48000, 16000)
+    framed = np.concatenate([resampler(frame) for frame in np.split(samples, 50)])
+    np.testing.assert_allclose(framed, whole, atol=1e-2)
+
+
+def test_passband_is_kept_and_aliases_are_removed():
+    assert amplitude(PolyphaseResampler(16000, 8000)(sine(1000, 16000, 0.5))) == (
+        pytest.approx(10000, rel=0.05)
+    )
+    # above the new nyquist frequency, it would alias to 2 kHz
+    assert amplitude(PolyphaseResampler(16000, 8000)(sine(6000, 16000, 0.5))) < 100
+
+
+def test_equal_rates_pass_through():
+    samples = sine(440, 16000, 0.1)
+    assert PolyphaseResampler(16000, 16000)(samples) is samples
@@ -0,0 +1,53 @@
+import pytest
+from pycommons.audio.ringbuffer import RingBuffer
+
+
+def frame(value: int) -> bytes:
+    return bytes([value]) * 4
+
+
+def test_frames_come_out_in_order():
+    buffer = RingBuffer(4, 4, max_frames=2)
+    for value in range(3):
+        buffer.write(frame(value))
+    view = buffer.peek()
+    assert bytes(view) == frame(0) + frame(1)
+    buffer.release(view)
+    view = buffer.peek()
+    assert bytes(view) == frame(2)
+    buffer.release(view)
+    assert len(buffer.peek()) == 0
+
+
+def test_view_is_contiguous_across_the_end():
+    buffer = RingBuffer(4, 4, max_frames=3)
+    for value in range(3):
+        buffer.write(frame(value))
+    buffer.release(buffer.peek())
+    for value in range(3, 6):
+        buffer.write(frame(value))
+    # slots 3, 0 and 1 through the mirror behind the storage
+    assert bytes(buffer.peek()) == frame(3) + frame(4) + frame(5)
+
+
+def test_drop_oldest_skips_overwritten_frames():
+    buffer = RingBuffer(4, 4, max_frames=4, drop_policy="oldest")
+    for value in range(6):
+        buffer.write(frame(value))
+    assert bytes(buffer.peek()) == b"".join(frame(value) for value in range(2, 6))
+    assert buffer.overflows == 2
+
+
+def test_drop_newest_keeps_buffered_frames():
+    buffer = RingBuffer(4, 4, max_frames=4, drop_policy="newest")
+    for value in range(6):
+        buffer.write(frame(value))
+    assert bytes(buffer.peek()) == b"".join(frame(value) for value in range(4))
+    assert buffer.overflows == 2
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        RingBuffer(4, 4, drop_policy="random")
+    with pytest.raises(ValueError):
+        RingBuffer(4, 4, max_frames=5)